@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
+
+The async auth views under /users/async/ run natively on the event loop when
+served from here, e.g. ``uvicorn config.asgi:application --workers 4``.
 """
 
 import os
@@ -14,3 +17,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+from users.tokens import warm_blacklist_filter  # noqa: E402
+
+warm_blacklist_filter()
@@ -1,5 +1,5 @@
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,6 +39,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shared.metrics.MetricsMiddleware',
+    'shared.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,13 +51,53 @@ MIDDLEWARE = [
 ]
 
 
+# Requests running more SQL queries than their view's query_budget are logged
+# with the offending statements (shared.query_budget); the test runner fails them.
+QUERY_BUDGET = {
+    "ENABLED": config("QUERY_BUDGET_ENABLED", default=True, cast=bool),
+    "MODE": "log",
+    # record the origin of every statement, not only of those past the budget
+    "CAPTURE_STACKS": False,
+}
+TEST_RUNNER = 'shared.test_runner.QueryBudgetTestRunner'
+
+# GET /metrics (shared.metrics) is closed unless one of these is set. With
+# TOKEN, scrapers send "Authorization: Bearer <token>" and ALLOWED_IPS is
+# ignored. ALLOWED_IPS is matched against REMOTE_ADDR, which is the proxy's
+# address behind nginx, so only use it when the proxy does not pass /metrics.
+METRICS = {
+    "TOKEN": config("METRICS_TOKEN", default=""),
+    "ALLOWED_IPS": config("METRICS_ALLOWED_IPS", default="", cast=Csv()),
+}
+
+
 REST_FRAMEWORK ={
     'DEFAULT_PERMISSION_CLASSES': [
         "rest_framework.permissions.IsAuthenticated", ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
         'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    ]
+        'users.authentication.CachedJWTAuthentication',
+    ],
+    # Reverse proxies in front of Django. Throttles take the client IP from the
+    # X-Forwarded-For entry added by the outermost one, or from REMOTE_ADDR
+    # when 0; a client-supplied X-Forwarded-For is never trusted on its own.
+    'NUM_PROXIES': config("NUM_PROXIES", default=0, cast=int),
+}
+
+# Sliding window limits for the public auth endpoints (shared.throttling).
+# RATES[<view throttle_scope>][ip|account|email]; BACKEND "local" counts per
+# process, "cache" counts in settings.CACHES[CACHE] across processes.
+THROTTLING = {
+    "ENABLED": config("THROTTLING_ENABLED", default=True, cast=bool),
+    "BACKEND": "local",
+    "CACHE": "default",
+    "MAX_KEYS": 100000,
+    "RATES": {
+        "login": {"ip": "30/min", "account": "5/min"},
+        "signup": {"ip": "10/min", "email": "3/hour"},
+        "new_verify": {"ip": "10/min", "account": "3/10min"},
+        "forgot_password": {"ip": "10/min", "email": "3/hour"},
+    },
 }
 
 SIMPLE_JWT = {
@@ -98,6 +140,34 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
 }
 
+# Users resolved from access tokens (users.authentication.CachedJWTAuthentication).
+# "django" uses settings.CACHES[CACHE], where saving a user drops the entry for
+# every process. "local" is a per-process TTL/LRU cache that other processes
+# only notice changes in after TTL seconds; use it with a single worker only.
+AUTH_USER_CACHE = {
+    "BACKEND": config("AUTH_USER_CACHE_BACKEND", default="django"),
+    "TTL": 60,
+    "MAX_SIZE": 10000,
+    "CACHE": "default",
+}
+
+# GET /users/me/ payloads, keyed on (id, updated_time)
+PROFILE_CACHE = {
+    "TTL": 300,
+    "MAX_SIZE": 10000,
+}
+
+# In-process Bloom filter of blacklisted refresh token JTIs (users.tokens).
+# Tokens blacklisted by another process are seen after at most SYNC_INTERVAL seconds.
+JTI_BLACKLIST_FILTER = {
+    "CAPACITY": 1_000_000,
+    "ERROR_RATE": 0.001,
+    "SYNC_INTERVAL": 5.0,
+    "REBUILD_INTERVAL": 3600.0,
+    # build the filter when config.wsgi / config.asgi is loaded
+    "WARM_ON_STARTUP": True,
+}
+
 
 ROOT_URLCONF = 'config.urls'
 
@@ -134,6 +204,18 @@ DATABASES = {
     }
 }
 
+# Caches that several processes share (AUTH_USER_CACHE, THROTTLING "cache",
+# VERIFICATION_CODE). The local memory default is per process: point it at
+# Redis or Memcached when running more than one worker, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        'LOCATION': config("CACHE_LOCATION", default=""),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -153,6 +235,29 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The first entry hashes new passwords; older hashes are upgraded on login.
+# "argon2" needs the argon2-cffi package.
+PASSWORD_HASHER = config("PASSWORD_HASHER", default="scrypt")
+_PASSWORD_HASHERS = {
+    "scrypt": "django.contrib.auth.hashers.ScryptPasswordHasher",
+    "argon2": "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + ["django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher"]
+
+# Password hashing runs in a pool of worker processes (shared.passwords).
+# WORKERS = 0 hashes inline in the request thread.
+PASSWORD_HASHING = {
+    "WORKERS": config("PASSWORD_HASHING_WORKERS", default=2, cast=int),
+    # hashes in flight at once; further requests wait up to TIMEOUT seconds, then get 429
+    "MAX_CONCURRENCY": config("PASSWORD_HASHING_MAX_CONCURRENCY", default=4, cast=int),
+    "TIMEOUT": 10.0,
+    # separate worker processes for bulk imports (users.importer); 0 hashes inline
+    "IMPORT_WORKERS": config("PASSWORD_HASHING_IMPORT_WORKERS", default=1, cast=int),
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
@@ -175,6 +280,25 @@ STATIC_ROOT  = BASE_DIR / 'staticfiles/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media/'
 
+USER_PHOTOS = {
+    # uploads above MAX_SIZE bytes are rejected while they are being received
+    "MAX_SIZE": config("USER_PHOTO_MAX_SIZE", default=10 * 1024 * 1024, cast=int),
+    "MAX_PIXELS": 40_000_000,
+    # longest side of each WEBP derivative; User.photo points at the first
+    "SIZES": (1080, 320, 150),
+    "QUALITY": 80,
+    "WORKERS": config("USER_PHOTO_WORKERS", default=2, cast=int),
+    # uploads waiting or being processed at once; beyond that uploads get 429
+    "QUEUE_SIZE": 100,
+}
+
+PROTECTED_MEDIA = {
+    # "nginx" (X-Accel-Redirect), "apache" (X-Sendfile) or "django" (FileResponse)
+    "BACKEND": config("PROTECTED_MEDIA_BACKEND", default="django"),
+    # nginx: location /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+    "INTERNAL_URL": config("PROTECTED_MEDIA_INTERNAL_URL", default="/protected-media/"),
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -182,6 +306,39 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'users.User'
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+VERIFICATION_CODE = {
+    # users.verification.HMACCodeBackend derives codes from the user and the
+    # time window instead of storing a UserConfirmation row per code
+    "BACKEND": config("VERIFICATION_CODE_BACKEND", default="users.verification.DatabaseCodeBackend"),
+    # HMAC backend only: window length in seconds and cache for the replay guard
+    "WINDOW": 300,
+    "CACHE": "default",
+}
+
+EMAIL_DISPATCHER = {
+    "WORKERS": config("EMAIL_WORKERS", default=4, cast=int),
+    "QUEUE_SIZE": config("EMAIL_QUEUE_SIZE", default=1000, cast=int),
+    # "block" waits up to PUT_TIMEOUT seconds for a free slot, "drop" sheds at once
+    "OVERFLOW": "block",
+    "PUT_TIMEOUT": 2.0,
+    # messages sent per send_messages() call on a worker's open connection
+    "BATCH_SIZE": 50,
+    # seconds a worker keeps an unused connection open
+    "IDLE_TIMEOUT": 30.0,
+}
+
+EMAIL_OUTBOX = {
+    # send right after commit from this process; set to False when dedicated
+    # `manage.py drain_email_outbox --loop` processes do the sending
+    "INLINE_DRAIN": config("EMAIL_OUTBOX_INLINE_DRAIN", default=True, cast=bool),
+    # seconds a freshly queued email is left to the inline sender
+    "LEASE": 60,
+    "MAX_ATTEMPTS": 8,
+    # retry delay is BACKOFF_BASE * 2 ** (attempts - 1), capped at BACKOFF_MAX seconds
+    "BACKOFF_BASE": 30,
+    "BACKOFF_MAX": 3600,
+}
+
 
 JAZZMIN_SETTINGS = {
     "site_title": "Instagram API",
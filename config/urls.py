@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.urls import path, include
+from shared.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('users/', include('users.urls'))
+    path('users/', include('users.urls')),
+    path('metrics', metrics_view),
 ]
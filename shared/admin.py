@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import EmailOutbox
 
 # Register your models here.
+
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['to_email', 'status', 'attempts', 'next_attempt_time', 'sent_time']
+    list_filter = ['status']
+admin.site.register(EmailOutbox, EmailOutboxAdmin)
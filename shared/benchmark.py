@@ -0,0 +1,106 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+
+# Helpers for the bench_* management commands that drive a running server.
+
+def percentile(samples, percent):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+class HttpConnection:
+    # Minimal keep-alive HTTP/1.1 client, enough to load a server from one
+    # event loop with thousands of concurrent connections.
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None, headers=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = b''
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        if body is not None:
+            payload = json.dumps(body).encode()
+            lines += ["Content-Type: application/json", f"Content-Length: {len(payload)}"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + payload)
+        try:
+            status, response_headers, content = await self._read_response()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            await self.close()
+            raise
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, response_headers, content
+
+    async def _read_response(self):
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode('latin-1').split("\r\n")
+        headers = {}
+        for line in header_lines:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            content = bytearray()
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+                content += chunk[:-2]
+        else:
+            content = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        return int(status_line.split()[1]), headers, bytes(content)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def run_load(base_url, make_request, total, concurrency):
+    # make_request(connection, index) -> awaitable returning the HTTP status.
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        connection = HttpConnection(base_url)
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                status = await make_request(connection, index)
+            except (OSError, asyncio.IncompleteReadError):
+                status = 0
+            latencies.append(time.perf_counter() - started)
+            if not 200 <= status < 400:
+                errors += 1
+        await connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
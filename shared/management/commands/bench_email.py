@@ -0,0 +1,62 @@
+import threading
+import time
+from django.core.mail import EmailMessage
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from shared.utility import EmailDispatcher
+
+
+class Command(BaseCommand):
+    help = "Measure email throughput (messages per second) of the email layer."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument(
+            '--backend',
+            default='django.core.mail.backends.locmem.EmailBackend',
+            help="Email backend to benchmark, e.g. the SMTP backend pointed at a local sink "
+                 "(python -m aiosmtpd -n -l localhost:8025) with --host/--port."
+        )
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--port', type=int, default=8025)
+
+    def handle(self, *args, **options):
+        with override_settings(
+            EMAIL_BACKEND=options['backend'],
+            EMAIL_HOST=options['host'],
+            EMAIL_PORT=options['port'],
+        ):
+            messages = options['messages']
+            thread_rate = self.run_thread_per_message(messages)
+            self.stdout.write(f"thread per message: {thread_rate:.1f} msg/s")
+            pool_rate, stats = self.run_dispatcher(messages, options['workers'], options['batch_size'])
+            self.stdout.write(f"dispatcher:         {pool_rate:.1f} msg/s")
+            self.stdout.write(f"dispatcher stats:   {stats}")
+
+    @staticmethod
+    def build_messages(count):
+        return [
+            EmailMessage(subject="Benchmark", body="<b>1234</b>", to=[f"bench-{i}@example.com"])
+            for i in range(count)
+        ]
+
+    def run_thread_per_message(self, count):
+        messages = self.build_messages(count)
+        started = time.monotonic()
+        threads = [threading.Thread(target=message.send) for message in messages]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return count / (time.monotonic() - started)
+
+    def run_dispatcher(self, count, workers, batch_size):
+        messages = self.build_messages(count)
+        dispatcher = EmailDispatcher(workers=workers, queue_size=count, batch_size=batch_size)
+        started = time.monotonic()
+        for message in messages:
+            dispatcher.submit(message)
+        dispatcher.shutdown()
+        return count / (time.monotonic() - started), dispatcher.stats()
@@ -0,0 +1,33 @@
+import timeit
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from shared.utility import EmailTemplateCache
+
+
+class Command(BaseCommand):
+    help = "Compare render_to_string with the cached email template renderer."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', default='email/authentication/activate_account.html')
+        parser.add_argument('--number', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        template_name = options['template']
+        number = options['number']
+        cache = EmailTemplateCache()
+
+        assert cache.render(template_name, "1234") == render_to_string(template_name, {"code": "1234"})
+
+        results = {
+            "render_to_string": timeit.timeit(
+                lambda: render_to_string(template_name, {"code": "1234"}), number=number
+            ),
+            "EmailTemplateCache": timeit.timeit(
+                lambda: cache.render(template_name, "1234"), number=number
+            ),
+            "EmailTemplateCache (language given)": timeit.timeit(
+                lambda: cache.render(template_name, "1234", "en-us"), number=number
+            ),
+        }
+        for name, total in results.items():
+            self.stdout.write(f"{name:<36} {total / number * 1e6:8.2f} us/render")
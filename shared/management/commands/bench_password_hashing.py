@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from shared.passwords import PasswordHashingPool
+
+HASHERS = {
+    "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "scrypt": "django.contrib.auth.hashers.ScryptPasswordHasher",
+    "argon2": "django.contrib.auth.hashers.Argon2PasswordHasher",
+}
+
+
+class Command(BaseCommand):
+    help = "Measure password verifications (logins) per second and per core for each hasher and pool size."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashers', default="pbkdf2,scrypt,argon2")
+        parser.add_argument('--workers', default=f"0,{os.cpu_count()}", help="Comma separated pool sizes, 0 = inline.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent login threads.")
+        parser.add_argument('--duration', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        cpus = os.cpu_count() or 1
+        self.stdout.write(f"{'hasher':<8} {'workers':>7} {'logins/s':>10} {'per core':>9}")
+        for name in options['hashers'].split(','):
+            hashers = [HASHERS[name]] + [path for key, path in HASHERS.items() if key != name]
+            with override_settings(PASSWORD_HASHERS=hashers):
+                try:
+                    encoded = make_password("bench-password")
+                except ValueError as e:
+                    self.stdout.write(f"{name:<8} skipped: {e}")
+                    continue
+                for workers in map(int, options['workers'].split(',')):
+                    pool = PasswordHashingPool(
+                        workers=workers,
+                        max_concurrency=options['concurrency'],
+                        hashers=hashers,
+                    )
+                    pool.verify("bench-password", encoded)
+                    rate = self.run(pool, encoded, options['concurrency'], options['duration'])
+                    pool.shutdown()
+                    cores = min(workers or options['concurrency'], cpus)
+                    self.stdout.write(f"{name:<8} {workers:>7} {rate:>10.1f} {rate / cores:>9.1f}")
+
+    @staticmethod
+    def run(pool, encoded, concurrency, duration):
+        count = [0] * concurrency
+        deadline = time.monotonic() + duration
+
+        def login(index):
+            while time.monotonic() < deadline:
+                pool.verify("bench-password", encoded)
+                count[index] += 1
+
+        threads = [threading.Thread(target=login, args=(index,)) for index in range(concurrency)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(count) / (time.monotonic() - started)
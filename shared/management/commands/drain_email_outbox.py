@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from shared.utility import drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Send pending emails from the outbox, retrying failures with exponential backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help="Keep draining until interrupted.")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the outbox is empty.")
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = drain_outbox(batch_size=options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f"sent={sent} failed={failed}")
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Done: sent={total_sent} failed={total_failed}"))
@@ -0,0 +1,113 @@
+import mimetypes
+import os
+import re
+import tempfile
+import uuid
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+range_regex = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FileRange:
+    # Read-limited view of an open file. FileResponse streams it, and WSGI
+    # servers with a sendfile() file_wrapper (gunicorn) send the byte range
+    # straight from the current offset for Content-Length bytes.
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    # Single byte ranges only; anything else is answered with the whole file.
+    match = range_regex.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if end < start and start < size:
+        return None
+    return start, end
+
+
+def serve_file(request, path, name, backend="django", internal_url="/protected-media/"):
+    # Access has to be checked by the caller. "nginx" hands the file to the
+    # proxy with X-Accel-Redirect (an `internal` location aliased to
+    # MEDIA_ROOT), "apache" with X-Sendfile (mod_xsendfile); both proxies then
+    # handle ranges themselves. "django" streams it with FileResponse.
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is not None:
+        return response
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if backend == "nginx":
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = internal_url + quote(name)
+    elif backend == "apache":
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        response = file_response(request, path, stat.st_size, etag, content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+
+def file_response(request, path, size, etag, content_type):
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if 'Range' in request.headers and (if_range is None or if_range == etag):
+        byte_range = parse_range(request.headers['Range'], size)
+    if byte_range is not None and byte_range[0] >= size:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def stage_upload(upload):
+    # The request deletes its temporary file when it ends, so background
+    # work gets a hard link to it (or a copy of an in-memory upload). The
+    # caller deletes the returned path.
+    if hasattr(upload, 'temporary_file_path'):
+        staged = f"{upload.temporary_file_path()}.{uuid.uuid4().hex}"
+        os.link(upload.temporary_file_path(), staged)
+        return staged
+    fd, staged = tempfile.mkstemp(suffix='.upload', dir=settings.FILE_UPLOAD_TEMP_DIR)
+    with os.fdopen(fd, 'wb') as destination:
+        for chunk in upload.chunks():
+            destination.write(chunk)
+    return staged
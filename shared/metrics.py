@@ -0,0 +1,232 @@
+import asyncio
+import bisect
+import hmac
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+class _Shard:
+    # Values written by one thread. The lock is only contended while a
+    # scrape reads the shard, so recording stays cheap.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+
+class Registry:
+    # Per-process metrics. Each thread writes to its own shard; render()
+    # merges the shards. Shards outlive their threads, so nothing is lost
+    # when a server recycles threads.
+
+    def __init__(self):
+        self._metrics = {}
+        self._shards = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(self, name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labels, buckets))
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def collect(self):
+        merged = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            with shard.lock:
+                items = [(key, list(value)) for key, value in shard.values.items()]
+            for key, value in items:
+                total = merged.setdefault(key, [0] * len(value))
+                for index, number in enumerate(value):
+                    total[index] += number
+        return merged
+
+    def render(self):
+        series = {}
+        for (name, label_values), value in sorted(self.collect().items()):
+            series.setdefault(name, []).append((label_values, value))
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for label_values, value in series.get(name, []):
+                lines.extend(metric.samples(label_values, value))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, documentation, labels=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def inc(self, *label_values, amount=1):
+        shard = self.registry.shard()
+        key = (self.name, label_values)
+        with shard.lock:
+            value = shard.values.get(key)
+            if value is None:
+                value = shard.values[key] = [0]
+            value[0] += amount
+
+    def samples(self, label_values, value):
+        return [f"{self.name}{_labels(self.labels, label_values)} {value[0]}"]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, amount, *label_values):
+        # value layout: [count per bucket..., +Inf count, sum]
+        shard = self.registry.shard()
+        key = (self.name, label_values)
+        index = bisect.bisect_left(self.buckets, amount)
+        with shard.lock:
+            value = shard.values.get(key)
+            if value is None:
+                value = shard.values[key] = [0] * (len(self.buckets) + 2)
+            value[index] += 1
+            value[-1] += amount
+
+    def samples(self, label_values, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), value[:-1]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{self.name}_bucket{_labels(self.labels, label_values, [('le', le)])} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {value[-1]}")
+        lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+registry = Registry()
+
+request_latency = registry.histogram(
+    "http_request_duration_seconds", "Request latency by resolved view.", ["view", "method"]
+)
+requests_total = registry.counter(
+    "http_requests_total", "Requests by resolved view and status code.", ["view", "method", "status"]
+)
+request_queries = registry.histogram(
+    "http_request_db_queries", "SQL queries per request.", ["view"], buckets=QUERY_COUNT_BUCKETS
+)
+request_db_time = registry.histogram(
+    "http_request_db_duration_seconds", "Time spent in SQL queries per request.", ["view"]
+)
+email_send_latency = registry.histogram(
+    "email_send_duration_seconds", "Time to hand one batch of emails to the backend.", ["sender"]
+)
+emails_total = registry.counter("emails_total", "Emails handed to the backend.", ["sender", "result"])
+jwt_issued = registry.counter("jwt_tokens_issued_total", "JWTs minted.", ["kind"])
+
+
+class QueryTimer:
+    # connection.execute_wrapper() hook counting the queries of one request.
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match._func_path if match is not None else "<unresolved>"
+
+
+def _record(request, response, started, queries=None):
+    view = _view_name(request)
+    request_latency.observe(time.perf_counter() - started, view, request.method)
+    requests_total.inc(view, request.method, str(response.status_code))
+    if queries is not None:
+        request_queries.observe(queries.count, view)
+        request_db_time.observe(queries.duration, view)
+
+
+@sync_and_async_middleware
+def MetricsMiddleware(get_response):
+    # Under ASGI the async ORM runs queries on another thread's connection,
+    # so async requests record latency and status only.
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            response = await get_response(request)
+            _record(request, response, started)
+            return response
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            queries = QueryTimer()
+            with connection.execute_wrapper(queries):
+                response = get_response(request)
+            _record(request, response, started, queries)
+            return response
+    return middleware
+
+
+def metrics_allowed(request):
+    # Closed unless configured: behind a reverse proxy every request comes
+    # from the proxy's address, so no address is trusted by default.
+    options = getattr(settings, "METRICS", {})
+    token = options.get("TOKEN")
+    if token:
+        header = request.headers.get('Authorization', '')
+        return hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+    return request.META.get('REMOTE_ADDR') in options.get("ALLOWED_IPS", ())
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponse(status=404)
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
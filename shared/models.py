@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import DatabaseError, models, router, transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
 import uuid
 
 # Create your models here.
@@ -8,4 +10,101 @@ class BaseModel(models.Model):
     updated_time = models.DateTimeField(auto_now=True)
 
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(BaseModel, cls).from_db(db, field_names, values)
+        instance._loaded_values = instance._field_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super(BaseModel, self).refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot(fields)
+
+    def _snapshot(self, fields=None):
+        # Marks the given fields (all loaded ones when None) as clean; local
+        # changes to the other fields stay dirty.
+        values = self._field_values()
+        loaded = getattr(self, '_loaded_values', None)
+        if fields is None or loaded is None:
+            self._loaded_values = values
+            return
+        names = {self._meta.get_field(field).name for field in fields}
+        loaded.update({name: value for name, value in values.items() if name in names})
+
+    def _field_values(self):
+        deferred = self.get_deferred_fields()
+        values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred:
+                continue
+            value = getattr(self, field.attname)
+            values[field.name] = value.name if isinstance(value, FieldFile) else value
+        return values
+
+    def get_dirty_fields(self):
+        # Names of the fields changed since the row was loaded or last saved,
+        # or None when that is unknown (new instance). A field that was
+        # deferred at load time and has been assigned since counts as changed.
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded is None:
+            return None
+        current = self._field_values()
+        return [name for name, value in current.items() if name not in loaded or loaded[name] != value]
+
+    def save(self, *args, **kwargs):
+        # Updates write only the changed columns (plus updated_time); saving an
+        # unchanged instance issues no query at all.
+        tracked = False
+        if not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            dirty = self.get_dirty_fields()
+            if dirty is not None:
+                kwargs['update_fields'] = dirty + ['updated_time'] if dirty else []
+                tracked = bool(dirty) and not kwargs.get('force_update')
+        try:
+            super(BaseModel, self).save(*args, **kwargs)
+        except DatabaseError as e:
+            # Django raises a bare DatabaseError when the update matched no
+            # row, i.e. the row was deleted after it was loaded. A plain save()
+            # inserts it again, so do the same. Nothing failed in the database,
+            # so the transaction Django marked for rollback is still usable.
+            if not tracked or type(e) is not DatabaseError:
+                raise
+            using = kwargs.get('using') or router.db_for_write(self.__class__, instance=self)
+            if transaction.get_connection(using).in_atomic_block:
+                transaction.set_rollback(False, using=using)
+            kwargs['update_fields'] = None
+            super(BaseModel, self).save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self._snapshot(None if update_fields is None else list(update_fields))
+
+
+class EmailOutbox(BaseModel):
+    PENDING, SENT, FAILED = ('pending', 'sent', 'failed')
+    STATUSES = (
+        (PENDING, PENDING),
+        (SENT, SENT),
+        (FAILED, FAILED)
+    )
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    content_type = models.CharField(max_length=16, default='html')
+    status = models.CharField(max_length=16, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_time = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    sent_time = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['next_attempt_time'],
+                condition=models.Q(status='pending'),
+                name='email_outbox_pending_idx'
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.to_email} ({self.status})"
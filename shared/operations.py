@@ -0,0 +1,47 @@
+from django.contrib.postgres import operations
+from django.db import migrations
+
+
+def is_postgres(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+class AddIndexConcurrently(operations.AddIndexConcurrently):
+    # CREATE INDEX CONCURRENTLY on PostgreSQL, a plain AddIndex elsewhere
+    # (the SQLite test database).
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if is_postgres(schema_editor):
+            return super(AddIndexConcurrently, self).database_forwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if is_postgres(schema_editor):
+            return super(AddIndexConcurrently, self).database_backwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class RemoveIndexConcurrently(operations.RemoveIndexConcurrently):
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if is_postgres(schema_editor):
+            return super(RemoveIndexConcurrently, self).database_forwards(app_label, schema_editor, from_state, to_state)
+        return migrations.RemoveIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if is_postgres(schema_editor):
+            return super(RemoveIndexConcurrently, self).database_backwards(app_label, schema_editor, from_state, to_state)
+        return migrations.RemoveIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class PostgresRunSQL(migrations.RunSQL):
+    # PostgreSQL-only DDL (CONCURRENTLY, operator classes, indexes on other
+    # apps' tables); a no-op on other databases.
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if is_postgres(schema_editor):
+            super(PostgresRunSQL, self).database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if is_postgres(schema_editor):
+            super(PostgresRunSQL, self).database_backwards(app_label, schema_editor, from_state, to_state)
@@ -0,0 +1,40 @@
+import json
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    # On PostgreSQL, result sets the planner estimates above `threshold` rows
+    # report that estimate instead of running an exact COUNT(*): reltuples for
+    # the whole table, the EXPLAIN row estimate for a filtered changelist.
+    threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or connections[queryset.db].vendor != 'postgresql':
+            return super(EstimatedCountPaginator, self).count
+        estimate = self.estimate(queryset)
+        if estimate is None or estimate < self.threshold:
+            return super(EstimatedCountPaginator, self).count
+        return estimate
+
+    @staticmethod
+    def estimate(queryset):
+        with connections[queryset.db].cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+                # -1 until the table has been vacuumed or analyzed
+                return row[0] if row and row[0] >= 0 else None
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
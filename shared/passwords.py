@@ -0,0 +1,168 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, identify_hasher, is_password_usable, make_password
+from rest_framework.exceptions import Throttled
+
+
+def _init_worker(settings_module, hashers):
+    if settings_module:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    import django
+    django.setup()
+    if hashers:
+        from django.contrib.auth import hashers as auth_hashers
+        settings.PASSWORD_HASHERS = hashers
+        auth_hashers.get_hashers.cache_clear()
+        auth_hashers.get_hashers_by_algorithm.cache_clear()
+
+
+def hash_password(raw_password):
+    return make_password(raw_password)
+
+
+def verify_password(raw_password, encoded):
+    # Same rules as django.contrib.auth.hashers.check_password(); returns
+    # (is_correct, must_update) so the caller can rehash with the preferred hasher.
+    if raw_password is None or not is_password_usable(encoded):
+        return False, False
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False, False
+    preferred = get_hasher("default")
+    hasher_changed = hasher.algorithm != preferred.algorithm
+    must_update = hasher_changed or preferred.must_update(encoded)
+    is_correct = hasher.verify(raw_password, encoded)
+    if not is_correct and not hasher_changed and must_update:
+        hasher.harden_runtime(raw_password, encoded)
+    return is_correct, is_correct and must_update
+
+
+class PasswordHashingPool:
+    # Runs hashing in worker processes so request threads don't hold the GIL
+    # (or every core) while PBKDF2/scrypt/Argon2 runs. At most max_concurrency
+    # hashes are in flight; callers wait up to timeout seconds for a slot and
+    # get 429 Throttled after that. workers=0 hashes inline in the caller.
+
+    def __init__(self, workers=2, max_concurrency=None, timeout=10.0, hashers=None):
+        self.workers = workers
+        self.timeout = timeout
+        self.hashers = hashers
+        self._slots = threading.BoundedSemaphore(max_concurrency or max(workers, 1) * 2)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # "spawn": forking a multi-threaded server process is unsafe.
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(os.environ.get("DJANGO_SETTINGS_MODULE"), self.hashers),
+                    )
+        return self._executor
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        for attempt in range(2):
+            executor = self.executor
+            try:
+                return self._call(executor, function, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed) and took the pool with it;
+                # retry once on a fresh one.
+                self._discard(executor)
+                if attempt:
+                    raise
+
+    def _call(self, executor, function, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise Throttled(detail="Server band, iltimos birozdan keyin qayta urinib ko'ring.")
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot stays taken until the worker is done, even if we stop waiting.
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise Throttled(detail="Server band, iltimos birozdan keyin qayta urinib ko'ring.")
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def hash(self, raw_password):
+        return self._run(hash_password, raw_password)
+
+    def verify(self, raw_password, encoded):
+        return self._run(verify_password, raw_password, encoded)
+
+    def hash_many(self, raw_passwords, chunksize=16):
+        # Bulk path for imports: no slots, so only use it on a pool that
+        # serves no requests (get_import_password_pool()).
+        if not self.workers:
+            return [hash_password(raw_password) for raw_password in raw_passwords]
+        executor = self.executor
+        try:
+            return list(executor.map(hash_password, raw_passwords, chunksize=chunksize))
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_password_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                options = getattr(settings, "PASSWORD_HASHING", {})
+                _pool = PasswordHashingPool(
+                    workers=options.get("WORKERS", 2),
+                    max_concurrency=options.get("MAX_CONCURRENCY"),
+                    timeout=options.get("TIMEOUT", 10.0),
+                )
+    return _pool
+
+
+_import_pool = None
+_import_pool_lock = threading.Lock()
+
+
+def get_import_password_pool():
+    # Imports hash in worker processes of their own, so thousands of queued
+    # import hashes never sit ahead of a login's verify() in the request pool.
+    global _import_pool
+    if _import_pool is None:
+        with _import_pool_lock:
+            if _import_pool is None:
+                options = getattr(settings, "PASSWORD_HASHING", {})
+                _import_pool = PasswordHashingPool(
+                    workers=options.get("IMPORT_WORKERS", 1),
+                    timeout=options.get("TIMEOUT", 10.0),
+                )
+    return _import_pool
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import traceback
+from django.conf import settings
+from django.db import connection
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+# Budgets exceeded while running the test suite; QueryBudgetTestRunner
+# reports them and fails the run.
+violations = []
+_violations_lock = threading.Lock()
+
+
+# Not counted: whether they are sent at all depends on the database backend.
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _options():
+    options = {"ENABLED": True, "MODE": "log", "CAPTURE_STACKS": False}
+    options.update(getattr(settings, "QUERY_BUDGET", {}))
+    return options
+
+
+def get_budget(view_func, method):
+    # A view declares `query_budget = 5`, or a dict per HTTP method such as
+    # {"get": 1, "post": 6}. None means the view has no budget.
+    view = getattr(view_func, 'view_class', view_func)
+    budget = getattr(view, 'query_budget', None)
+    if isinstance(budget, dict):
+        budget = budget.get(method.lower())
+    return budget
+
+
+def stack_origin(limit=3):
+    # Innermost project frames above the ORM call, skipping libraries and
+    # the other execute_wrapper() hooks.
+    base_dir = str(settings.BASE_DIR)
+    stack = traceback.extract_stack()
+    orm = next((index for index, frame in enumerate(stack) if f"django{os.sep}db{os.sep}" in frame.filename), len(stack))
+    frames = [
+        frame for frame in stack[:orm]
+        if frame.filename.startswith(base_dir)
+        and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+    return [
+        f"{os.path.relpath(frame.filename, base_dir)}:{frame.lineno} in {frame.name}"
+        for frame in frames[-limit:]
+    ]
+
+
+class QueryRecorder:
+    # connection.execute_wrapper() hook. Stacks are captured for every
+    # statement with CAPTURE_STACKS (tests), otherwise only for the ones
+    # past the budget, which is where an N+1 loop shows up.
+
+    def __init__(self, request, capture_stacks=False):
+        self.request = request
+        self.capture_stacks = capture_stacks
+        self.queries = []
+
+    @property
+    def budget(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return get_budget(match.func, self.request.method) if match is not None else None
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip()[:9].upper().startswith(TRANSACTION_STATEMENTS):
+            return execute(sql, params, many, context)
+        budget = self.budget
+        origin = None
+        if self.capture_stacks or (budget is not None and len(self.queries) >= budget):
+            origin = stack_origin()
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started, origin))
+
+    def report(self, budget):
+        match = self.request.resolver_match
+        lines = [f"{match._func_path} {self.request.method} ran {len(self.queries)} queries, budget {budget}:"]
+        for number, (sql, duration, origin) in enumerate(self.queries, start=1):
+            lines.append(f"  {number}. {duration * 1000:.1f}ms {sql[:300]}")
+            for frame in origin or []:
+                lines.append(f"       at {frame}")
+        return "\n".join(lines)
+
+
+def check_budget(recorder, mode):
+    budget = recorder.budget
+    if budget is None or len(recorder.queries) <= budget:
+        return
+    report = recorder.report(budget)
+    if mode == "raise":
+        with _violations_lock:
+            violations.append(report)
+        raise QueryBudgetExceeded(report)
+    logger.warning("Query budget exceeded: %s", report)
+
+
+@sync_and_async_middleware
+def QueryBudgetMiddleware(get_response):
+    # Counts the queries of each request against the resolved view's
+    # query_budget: MODE "log" logs offenders, "raise" (the test runner)
+    # fails the request. Async requests are not counted, for the same reason
+    # as in shared.metrics.
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            return await get_response(request)
+    else:
+        def middleware(request):
+            options = _options()
+            if not options["ENABLED"]:
+                return get_response(request)
+            recorder = QueryRecorder(request, capture_stacks=options["CAPTURE_STACKS"])
+            with connection.execute_wrapper(recorder):
+                response = get_response(request)
+            check_budget(recorder, options["MODE"])
+            return response
+    return middleware
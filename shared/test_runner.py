@@ -0,0 +1,35 @@
+import sys
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from shared import query_budget
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    # Runs the suite with QueryBudgetMiddleware in "raise" mode and stack
+    # capture on: a request over its view's query_budget fails the test that
+    # made it, and the run fails even if that test swallowed the error.
+
+    def setup_test_environment(self, **kwargs):
+        super(QueryBudgetTestRunner, self).setup_test_environment(**kwargs)
+        self._query_budget = override_settings(
+            QUERY_BUDGET={
+                **getattr(settings, "QUERY_BUDGET", {}),
+                "ENABLED": True,
+                "MODE": "raise",
+                "CAPTURE_STACKS": True,
+            }
+        )
+        self._query_budget.enable()
+        query_budget.violations.clear()
+
+    def teardown_test_environment(self, **kwargs):
+        self._query_budget.disable()
+        super(QueryBudgetTestRunner, self).teardown_test_environment(**kwargs)
+
+    def suite_result(self, suite, result, **kwargs):
+        failures = super(QueryBudgetTestRunner, self).suite_result(suite, result, **kwargs)
+        if query_budget.violations:
+            sys.stderr.write(f"\n{len(query_budget.violations)} request(s) exceeded their query budget:\n\n")
+            sys.stderr.write("\n\n".join(query_budget.violations) + "\n")
+        return failures + len(query_budget.violations)
@@ -1,5 +1,376 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+from django.conf import settings
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch
+from django.utils import timezone
+from rest_framework.exceptions import Throttled
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from . import passwords, query_budget, throttling
+from .media import parse_range, serve_file
+from .metrics import Registry, metrics_view
+from .models import EmailOutbox
+from .passwords import PasswordHashingPool
+from .query_budget import QueryBudgetExceeded, QueryBudgetMiddleware
+from .throttling import AccountThrottle, EmailThrottle, IPThrottle, LocalSlidingWindow, parse_rate
+from .utility import BloomFilter, drain_outbox
 
-# Create your tests here.
 
+class ParseRangeTests(SimpleTestCase):
 
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=990-2000', 1000), (990, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        # unsatisfiable: the caller answers 416
+        self.assertEqual(parse_range('bytes=1000-', 1000), (1000, 999))
+
+    def test_unsupported_ranges_are_ignored(self):
+        for header in ('bytes=-', 'bytes=0-1,5-6', 'items=0-1', 'bytes=5-2'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1000))
+
+
+class ServeFileTests(SimpleTestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.webp')
+        with os.fdopen(fd, 'wb') as file:
+            file.write(b"0123456789")
+        self.addCleanup(os.unlink, self.path)
+        self.factory = RequestFactory()
+
+    def test_etag_revalidation(self):
+        response = serve_file(self.factory.get('/'), self.path, 'photo.webp')
+        response.close()
+        again = serve_file(self.factory.get('/', HTTP_IF_NONE_MATCH=response['ETag']), self.path, 'photo.webp')
+        self.assertEqual(again.status_code, 304)
+
+    def test_stale_if_range_sends_the_whole_file(self):
+        request = self.factory.get('/', HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"')
+        response = serve_file(request, self.path, 'photo.webp')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+
+    def test_unsatisfiable_range(self):
+        response = serve_file(self.factory.get('/', HTTP_RANGE='bytes=20-'), self.path, 'photo.webp')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], "bytes */10")
+
+    def test_nginx_backend(self):
+        response = serve_file(self.factory.get('/'), self.path, 'user_photos/a b.webp', backend="nginx")
+        self.assertEqual(response['X-Accel-Redirect'], "/protected-media/user_photos/a%20b.webp")
+
+
+class RefusingEmailBackend(BaseEmailBackend):
+
+    def open(self):
+        raise ConnectionRefusedError("mail server is down")
+
+    def send_messages(self, email_messages):
+        raise AssertionError("not reached")
+
+
+def outbox_row(**kwargs):
+    return EmailOutbox.objects.create(
+        to_email='user@example.com', subject='Kod', body='<b>1234</b>', next_attempt_time=timezone.now(), **kwargs
+    )
+
+
+class DrainOutboxTests(TestCase):
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_sends_due_rows(self):
+        row = outbox_row()
+        self.assertEqual(drain_outbox(), (1, 0))
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (EmailOutbox.SENT, 1))
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+
+    @override_settings(EMAIL_BACKEND='shared.tests.RefusingEmailBackend')
+    def test_unreachable_server_schedules_retries(self):
+        rows = [outbox_row(), outbox_row()]
+        with self.assertLogs('shared.utility', 'WARNING'):
+            self.assertEqual(drain_outbox(), (0, 2))
+        for row in rows:
+            row.refresh_from_db()
+            self.assertEqual((row.status, row.attempts), (EmailOutbox.PENDING, 1))
+            self.assertIn('ConnectionRefusedError', row.last_error)
+            self.assertGreater(row.next_attempt_time, timezone.now())
+        # nothing is due until the backoff has passed
+        self.assertEqual(drain_outbox(), (0, 0))
+
+    @override_settings(EMAIL_BACKEND='shared.tests.RefusingEmailBackend')
+    def test_gives_up_after_max_attempts(self):
+        row = outbox_row(attempts=7)
+        with self.settings(EMAIL_OUTBOX={"MAX_ATTEMPTS": 8}), self.assertLogs('shared.utility', 'WARNING'):
+            drain_outbox()
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (EmailOutbox.FAILED, 8))
+
+
+class DirtyFieldTests(TestCase):
+
+    def setUp(self):
+        self.row = outbox_row()
+
+    def test_unchanged_save_runs_no_query(self):
+        row = EmailOutbox.objects.get(id=self.row.id)
+        with self.assertNumQueries(0):
+            row.save()
+
+    def test_save_writes_only_changed_columns(self):
+        row = EmailOutbox.objects.get(id=self.row.id)
+        row.subject = 'Yangi'
+        with CaptureQueriesContext(connection) as queries:
+            row.save()
+        sql = queries.captured_queries[-1]['sql']
+        self.assertIn('"subject"', sql)
+        self.assertNotIn('"body"', sql)
+
+    def test_assigned_deferred_field_is_saved(self):
+        row = EmailOutbox.objects.only('id', 'subject').get(id=self.row.id)
+        row.body = 'CHANGED'
+        self.assertEqual(row.get_dirty_fields(), ['body'])
+        row.save()
+        self.assertEqual(EmailOutbox.objects.get(id=row.id).body, 'CHANGED')
+
+    def test_loading_a_deferred_field_keeps_it_clean(self):
+        row = EmailOutbox.objects.only('id').get(id=self.row.id)
+        row.subject
+        self.assertEqual(row.get_dirty_fields(), [])
+
+    def test_partial_refresh_keeps_local_edits(self):
+        row = EmailOutbox.objects.get(id=self.row.id)
+        row.subject = 'LOCAL'
+        EmailOutbox.objects.filter(id=row.id).update(status=EmailOutbox.SENT)
+        row.refresh_from_db(fields=['status'])
+        self.assertEqual(row.status, EmailOutbox.SENT)
+        row.save()
+        self.assertEqual(EmailOutbox.objects.get(id=row.id).subject, 'LOCAL')
+
+    def test_save_with_update_fields_keeps_other_edits(self):
+        row = EmailOutbox.objects.get(id=self.row.id)
+        row.subject = 'LOCAL'
+        row.body = 'BODY'
+        row.save(update_fields=['body'])
+        self.assertEqual(row.get_dirty_fields(), ['subject'])
+        row.save()
+        self.assertEqual(EmailOutbox.objects.get(id=row.id).subject, 'LOCAL')
+
+    def test_save_after_delete_inserts_again(self):
+        row = EmailOutbox.objects.get(id=self.row.id)
+        EmailOutbox.objects.filter(id=row.id).delete()
+        row.status = EmailOutbox.SENT
+        row.save()
+        self.assertEqual(EmailOutbox.objects.get(id=row.id).status, EmailOutbox.SENT)
+        self.assertEqual(EmailOutbox.objects.get(id=row.id).subject, self.row.subject)
+
+    def test_forced_update_after_delete_still_raises(self):
+        row = EmailOutbox.objects.get(id=self.row.id)
+        EmailOutbox.objects.filter(id=row.id).delete()
+        row.status = EmailOutbox.SENT
+        with self.assertRaises(DatabaseError):
+            row.save(force_update=True)
+
+
+class ThrottleView:
+    throttle_scope = 'login'
+
+
+@override_settings(THROTTLING={"ENABLED": True, "BACKEND": "local", "RATES": {"login": {"ip": "3/min"}}})
+class IPThrottleTests(SimpleTestCase):
+
+    def setUp(self):
+        throttling._storage = None
+        self.addCleanup(setattr, throttling, '_storage', None)
+        self.factory = APIRequestFactory()
+
+    def attempts(self, count, headers=lambda number: {}):
+        results = []
+        with self.assertLogs('shared.throttling', 'WARNING'):
+            for number in range(count):
+                request = self.factory.post('/users/login/', REMOTE_ADDR='203.0.113.7', **headers(number))
+                results.append(IPThrottle().allow_request(request, ThrottleView()))
+        return results
+
+    def test_limits_one_address(self):
+        self.assertEqual(self.attempts(5), [True, True, True, False, False])
+
+    def test_ignores_spoofed_forwarded_for(self):
+        spoofed = self.attempts(5, lambda number: {'HTTP_X_FORWARDED_FOR': f"198.51.100.{number}"})
+        self.assertEqual(spoofed, [True, True, True, False, False])
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_behind_a_proxy_uses_the_address_it_added(self):
+        # the proxy appends the real client address to whatever the client sent
+        spoofed = self.attempts(5, lambda number: {'HTTP_X_FORWARDED_FOR': f"198.51.100.{number}, 192.0.2.1"})
+        self.assertEqual(spoofed, [True, True, True, False, False])
+
+    def test_json_array_body_has_no_key(self):
+        request = Request(self.factory.post('/users/signup/', [1], format='json'), parsers=[JSONParser()])
+        self.assertIsNone(EmailThrottle().get_key(request, ThrottleView()))
+        self.assertIsNone(AccountThrottle().get_key(request, ThrottleView()))
+
+
+class SlidingWindowTests(SimpleTestCase):
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("5/min"), (5, 60))
+        self.assertEqual(parse_rate("3/10min"), (3, 600))
+        self.assertEqual(parse_rate("100/hour"), (100, 3600))
+
+    def test_previous_window_is_weighted(self):
+        window = LocalSlidingWindow()
+        with mock.patch('shared.throttling.time.time', return_value=1200.0):
+            self.assertEqual([window.hit('k', 4, 60)[0] for _ in range(5)], [True] * 4 + [False])
+        # a quarter into the next window, 3 of the previous 4 hits still count
+        with mock.patch('shared.throttling.time.time', return_value=1275.0):
+            self.assertEqual([window.hit('k', 4, 60)[0] for _ in range(2)], [True, False])
+
+
+def crash_worker():
+    os._exit(1)
+
+
+class PasswordHashingPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = PasswordHashingPool(workers=1, max_concurrency=1, timeout=5.0)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_hash_and_verify(self):
+        encoded = self.pool.hash("Parol-12345")
+        self.assertEqual(self.pool.verify("Parol-12345", encoded), (True, False))
+        self.assertEqual(self.pool.verify("boshqa", encoded), (False, False))
+
+    def test_recovers_from_a_dead_worker(self):
+        with self.assertRaises(BrokenProcessPool):
+            self.pool._run(crash_worker)
+        self.assertEqual(self.pool.verify("x", self.pool.hash("x")), (True, False))
+
+    def test_waits_at_most_timeout(self):
+        self.pool.hash("warm up")
+        self.pool.timeout = 0.5
+        with self.assertRaises(Throttled):
+            self.pool._run(time.sleep, 2)
+
+    def test_singleton_is_created_once(self):
+        def slow_pool(**options):
+            time.sleep(0.05)
+            return object()
+
+        self.addCleanup(setattr, passwords, '_pool', passwords._pool)
+        passwords._pool = None
+        with mock.patch('shared.passwords.PasswordHashingPool', side_effect=slow_pool) as pool_class:
+            pools = []
+            threads = [threading.Thread(target=lambda: pools.append(passwords.get_password_pool())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(pool_class.call_count, 1)
+        self.assertEqual(len(set(map(id, pools))), 1)
+
+
+class MetricsViewTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    @override_settings(METRICS={"TOKEN": "", "ALLOWED_IPS": []})
+    def test_closed_by_default(self):
+        self.assertEqual(metrics_view(self.factory.get('/metrics', REMOTE_ADDR='127.0.0.1')).status_code, 404)
+
+    @override_settings(METRICS={"TOKEN": "s3cret", "ALLOWED_IPS": ['127.0.0.1']})
+    def test_token(self):
+        self.assertEqual(metrics_view(self.factory.get('/metrics', REMOTE_ADDR='127.0.0.1')).status_code, 404)
+        wrong = self.factory.get('/metrics', HTTP_AUTHORIZATION='Bearer nope')
+        self.assertEqual(metrics_view(wrong).status_code, 404)
+        response = metrics_view(self.factory.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"# TYPE http_requests_total counter", response.content)
+
+    @override_settings(METRICS={"TOKEN": "", "ALLOWED_IPS": ['10.0.0.5']})
+    def test_allowed_ips(self):
+        self.assertEqual(metrics_view(self.factory.get('/metrics', REMOTE_ADDR='10.0.0.5')).status_code, 200)
+        self.assertEqual(metrics_view(self.factory.get('/metrics', REMOTE_ADDR='10.0.0.6')).status_code, 404)
+
+
+class RegistryTests(SimpleTestCase):
+
+    def test_merges_thread_shards(self):
+        registry = Registry()
+        counter = registry.counter("jobs_total", "Jobs.", ["kind"])
+        histogram = registry.histogram("job_seconds", "Job time.", buckets=(0.1, 1.0))
+        threads = [threading.Thread(target=lambda: [counter.inc("a") for _ in range(100)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        output = registry.render()
+        self.assertIn('jobs_total{kind="a"} 400', output)
+        self.assertIn('job_seconds_bucket{le="0.1"} 1', output)
+        self.assertIn('job_seconds_bucket{le="1.0"} 2', output)
+        self.assertIn('job_seconds_bucket{le="+Inf"} 3', output)
+        self.assertIn('job_seconds_count 3', output)
+
+
+class BloomFilterTests(SimpleTestCase):
+
+    def test_no_false_negatives_and_few_false_positives(self):
+        bloom = BloomFilter(10000, error_rate=0.01)
+        for number in range(10000):
+            bloom.add(f"jti-{number}")
+        self.assertTrue(all(f"jti-{number}" in bloom for number in range(10000)))
+        false_positives = sum(f"other-{number}" in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+def two_queries(request):
+    list(EmailOutbox.objects.all())
+    list(EmailOutbox.objects.all())
+    return HttpResponse()
+
+
+two_queries.query_budget = 1
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+
+    def call(self, mode):
+        request = RequestFactory().get('/')
+        request.resolver_match = ResolverMatch(two_queries, (), {})
+        middleware = QueryBudgetMiddleware(two_queries)
+        with self.settings(QUERY_BUDGET={"ENABLED": True, "MODE": mode, "CAPTURE_STACKS": False}):
+            return middleware(request)
+
+    def test_log_mode(self):
+        with self.assertLogs('shared.query_budget', 'WARNING') as logs:
+            self.assertEqual(self.call("log").status_code, 200)
+        self.assertIn("ran 2 queries, budget 1", logs.output[0])
+
+    def test_raise_mode_reports_where_the_extra_query_came_from(self):
+        # keep this deliberate violation out of the runner's report
+        self.addCleanup(query_budget.violations.__delitem__, slice(len(query_budget.violations), None))
+        with self.assertRaises(QueryBudgetExceeded) as caught:
+            self.call("raise")
+        report = str(caught.exception)
+        self.assertIn("ran 2 queries, budget 1", report)
+        self.assertIn("in two_queries", report)
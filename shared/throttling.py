@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+from collections import Counter
+from collections.abc import Mapping
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+from shared.utility import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+DURATIONS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    # "5/min", "3/10min", "100/hour" -> (requests, seconds)
+    count, period = rate.split('/')
+    digits = period.rstrip('abcdefghijklmnopqrstuvwxyz')
+    return int(count), int(digits or 1) * DURATIONS[period[len(digits):]]
+
+
+class LocalSlidingWindow:
+    # Sliding window counter: the previous fixed window's count is weighted by
+    # how much of it still overlaps the sliding window. Two integers per key,
+    # O(1) per check; idle keys expire and the key count is capped (LRU).
+
+    def __init__(self, max_keys=100000):
+        self._windows = TTLCache(max_size=max_keys, ttl=86400 * 2)
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, period):
+        now = time.time()
+        window = int(now // period)
+        with self._lock:
+            start, current, previous = self._windows.get(key) or (window, 0, 0)
+            if start != window:
+                previous = current if start == window - 1 else 0
+                current = 0
+            allowed = self._estimate(now, period, current, previous) < limit
+            if allowed:
+                current += 1
+            self._windows.set(key, (window, current, previous))
+        return allowed, self._retry_after(now, period, limit, current, previous)
+
+    @staticmethod
+    def _estimate(now, period, current, previous):
+        return previous * (1 - (now % period) / period) + current
+
+    @staticmethod
+    def _retry_after(now, period, limit, current, previous):
+        if current >= limit:
+            return period - now % period
+        if not previous:
+            return 0
+        # time until the weighted previous window has decayed enough
+        overlap = (limit - current) / previous
+        return max(0.0, period * (1 - overlap) - now % period)
+
+
+class CacheSlidingWindow(LocalSlidingWindow):
+    # Same counter kept in a Django cache (e.g. a local Redis/Memcached shared
+    # by all workers); the current window is bumped with an atomic incr().
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def hit(self, key, limit, period):
+        now = time.time()
+        window = int(now // period)
+        current_key, previous_key = f"throttle:{key}:{window}", f"throttle:{key}:{window - 1}"
+        counts = self.cache.get_many([current_key, previous_key])
+        current, previous = counts.get(current_key, 0), counts.get(previous_key, 0)
+        allowed = self._estimate(now, period, current, previous) < limit
+        if allowed:
+            self.cache.add(current_key, 0, period * 2)
+            current = self.cache.incr(current_key)
+        return allowed, self._retry_after(now, period, limit, current, previous)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+_decisions = Counter()
+_decisions_lock = threading.Lock()
+
+
+def get_throttle_decisions():
+    # {(scope, kind, "allowed" | "rejected"): count} for this process
+    with _decisions_lock:
+        return dict(_decisions)
+
+
+def get_throttle_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                options = getattr(settings, 'THROTTLING', {})
+                if options.get('BACKEND', 'local') == 'cache':
+                    _storage = CacheSlidingWindow(options.get('CACHE', 'default'))
+                else:
+                    _storage = LocalSlidingWindow(options.get('MAX_KEYS', 100000))
+    return _storage
+
+
+def throttle_hit(scope, kind, key):
+    # Counts one request for key; returns (allowed, seconds to wait).
+    options = getattr(settings, 'THROTTLING', {})
+    rate = options.get('RATES', {}).get(scope, {}).get(kind)
+    if not options.get('ENABLED', True) or rate is None or not key:
+        return True, None
+    limit, period = parse_rate(rate)
+    allowed, wait_time = get_throttle_storage().hit(f"{scope}:{kind}:{key}", limit, period)
+    with _decisions_lock:
+        _decisions[(scope, kind, 'allowed' if allowed else 'rejected')] += 1
+    if allowed:
+        return True, None
+    logger.warning("Throttled %s request by %s %s (rate %s)", scope, kind, key, rate)
+    return False, wait_time
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    # Rates come from settings.THROTTLING['RATES'][view.throttle_scope][kind].
+    # Views without a rate for this kind are not throttled by it.
+    kind = None
+
+    def get_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        allowed, self.wait_time = throttle_hit(
+            getattr(view, 'throttle_scope', None), self.kind, self.get_key(request, view)
+        )
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class IPThrottle(SlidingWindowThrottle):
+    kind = 'ip'
+
+    def get_key(self, request, view):
+        return self.get_ident(request)
+
+
+def request_data(request):
+    # A JSON array body parses to a list; the view's serializer rejects it
+    # with a 400, so the throttles just find no key in it.
+    return request.data if isinstance(request.data, Mapping) else {}
+
+
+class AccountThrottle(SlidingWindowThrottle):
+    # The authenticated user, or the account named in a login attempt.
+    kind = 'account'
+
+    def get_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return str(request.user.pk)
+        data = request_data(request)
+        user_input = data.get('userinput') or data.get('username')
+        return str(user_input).lower() if user_input else None
+
+
+class EmailThrottle(SlidingWindowThrottle):
+    kind = 'email'
+
+    def get_key(self, request, view):
+        email = request_data(request).get('email')
+        return str(email).lower() if email else None
@@ -1,10 +1,28 @@
+import atexit
+import hashlib
+import logging
+import math
+import os
+import queue
 import threading
-from django.core.mail import EmailMessage
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.core.mail import EmailMessage, get_connection
 from rest_framework.exceptions import ValidationError
-from django.template.loader import render_to_string
+from django.template.loader import select_template
+from django.utils import timezone, translation
+from django.utils.html import escape
+from shared.models import EmailOutbox
+from shared.metrics import email_send_latency, emails_total
 import re
 
 
+logger = logging.getLogger(__name__)
+
 username_regex = re.compile(r"^[a-zA-Z0-9_.-]+$")
 email_regex = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b")
 
@@ -23,17 +41,273 @@ def check_user_type(user_input):
         )
     return user_input
 
-class EmailThread(threading.Thread):
-    def __init__(self, email):
-        self.email = email
-        threading.Thread.__init__(self)
+class BloomFilter:
+    # Set membership without false negatives; false positives happen at about
+    # error_rate once capacity items have been added.
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        positions = self._positions(value)
+        with self._lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class TTLCache:
+    # Thread-safe per-process cache: entries expire after ttl seconds and the
+    # least recently used ones are evicted beyond max_size.
+    def __init__(self, max_size=10000, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Fixed pool of email workers fed from a bounded queue. When the queue is full
+# submit() waits up to put_timeout seconds ("block") or gives up at once ("drop").
+class EmailDispatcher:
+    _STOP = object()
+
+    def __init__(self, workers=4, queue_size=1000, overflow="block", put_timeout=2.0,
+                 batch_size=50, idle_timeout=30.0):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.overflow = overflow
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._started = False
+        self._sent = 0
+        self._failed = 0
+        self._dropped = 0
+        self._batches = 0
+        self._send_time = 0.0
+        self._send_time_max = 0.0
+        self._wait_time = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._run, name=f"email-dispatcher-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+        atexit.register(self.shutdown)
+
+    def submit(self, email, callback=None):
+        if not self._started:
+            self.start()
+        item = (email, time.monotonic(), callback)
+        try:
+            if self.overflow == "drop":
+                self.queue.put_nowait(item)
+            else:
+                self.queue.put(item, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            logger.warning("Email queue is full, dropping message to %s", email.to)
+            return False
+        return True
+
+    def _run(self):
+        # Each worker keeps one backend connection open across messages and
+        # sends whatever is already queued as a single batch.
+        connection = None
+        while True:
+            try:
+                item = self.queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                connection = self._close(connection)
+                continue
+            batch = []
+            stop = False
+            while True:
+                if item is self._STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    connection = self._send(connection, batch)
+            finally:
+                for _ in range(len(batch) + stop):
+                    self.queue.task_done()
+            if stop:
+                self._close(connection)
+                return
+
+    def _send(self, connection, batch):
+        messages = [email for email, _, _ in batch]
+        started = time.monotonic()
+        try:
+            if connection is None:
+                connection = self._open()
+            connection.send_messages(messages)
+        except Exception:
+            # The connection may have been dropped by the server; reconnect and
+            # retry the batch once (delivery is at-least-once).
+            logger.warning("Email connection failed, reconnecting", exc_info=True)
+            self._close(connection)
+            try:
+                connection = self._open()
+                connection.send_messages(messages)
+            except Exception:
+                logger.exception("Failed to send %s email(s)", len(messages))
+                with self._lock:
+                    self._failed += len(messages)
+                emails_total.inc("dispatcher", "failed", amount=len(messages))
+                self._notify(batch, failed=True)
+                return self._close(connection)
+        elapsed = time.monotonic() - started
+        email_send_latency.observe(elapsed, "dispatcher")
+        emails_total.inc("dispatcher", "sent", amount=len(messages))
+        with self._lock:
+            self._sent += len(messages)
+            self._batches += 1
+            self._send_time += elapsed
+            self._send_time_max = max(self._send_time_max, elapsed)
+            self._wait_time += sum(started - enqueued_at for _, enqueued_at, _ in batch)
+        self._notify(batch, failed=False)
+        return connection
+
+    @staticmethod
+    def _notify(batch, failed):
+        for email, _, callback in batch:
+            if callback is None:
+                continue
+            try:
+                callback(email, failed)
+            except Exception:
+                logger.exception("Email callback failed for %s", email.to)
+
+    @staticmethod
+    def _open():
+        connection = get_connection()
+        connection.open()
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                logger.warning("Failed to close email connection", exc_info=True)
+        return None
+
+    def shutdown(self, timeout=None):
+        with self._lock:
+            if not self._started:
+                return
+            threads, self._threads = self._threads, []
+            self._started = False
+        # Sentinels go behind the messages already queued, so workers drain first.
+        for _ in threads:
+            self.queue.put(self._STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            sent = self._sent
+            return {
+                "queue_depth": self.queue.qsize(),
+                "queue_size": self.queue.maxsize,
+                "workers": len(self._threads),
+                "sent": sent,
+                "failed": self._failed,
+                "dropped": self._dropped,
+                "batches": self._batches,
+                "avg_batch_latency": self._send_time / self._batches if self._batches else 0.0,
+                "max_batch_latency": self._send_time_max,
+                "avg_queue_wait": self._wait_time / sent if sent else 0.0,
+            }
+
+
+_email_dispatcher = None
+_email_dispatcher_lock = threading.Lock()
+
+
+def get_email_dispatcher():
+    global _email_dispatcher
+    if _email_dispatcher is None:
+        with _email_dispatcher_lock:
+            if _email_dispatcher is None:
+                options = getattr(settings, "EMAIL_DISPATCHER", {})
+                _email_dispatcher = EmailDispatcher(
+                    workers=options.get("WORKERS", 4),
+                    queue_size=options.get("QUEUE_SIZE", 1000),
+                    overflow=options.get("OVERFLOW", "block"),
+                    put_timeout=options.get("PUT_TIMEOUT", 2.0),
+                    batch_size=options.get("BATCH_SIZE", 50),
+                    idle_timeout=options.get("IDLE_TIMEOUT", 30.0),
+                )
+    return _email_dispatcher
 
-    def run(self):
-        self.email.send()
 
 class Email:
     @staticmethod
-    def send_email(data):
+    def build_message(data):
         email = EmailMessage(
             subject=data['subject'],
             body=data['body'],
@@ -41,19 +315,221 @@ class Email:
         )
         if data.get('content_type') == 'html':
             email.content_subtype = 'html'
-        EmailThread(email).start()
+        return email
 
+    @staticmethod
+    def send_email(data):
+        return get_email_dispatcher().submit(Email.build_message(data))
 
-def send_email(email, code):
-    html_content = render_to_string(
-        'email/authentication/activate_account.html',
-        {"code": code}
+
+class EmailTemplateCache:
+    # Each template (and language variant) is compiled and rendered once with a
+    # marker in place of the code; later renders only join the cached pieces.
+    MARKER = "\x00code\x00"
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def render(self, template_name, code, language=None):
+        language = language or translation.get_language() or settings.LANGUAGE_CODE
+        key = (template_name, language)
+        entry = self._entries.get(key)
+        if entry is None or (settings.DEBUG and self._is_stale(entry)):
+            entry = self._compile(template_name, language)
+            with self._lock:
+                self._entries[key] = entry
+        template, parts, _, _ = entry
+        if parts is None:
+            return template.render({"code": code})
+        return escape(code).join(parts)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _compile(self, template_name, language):
+        template = select_template(self._candidates(template_name, language))
+        rendered = template.render({"code": self.MARKER})
+        # Fall back to a full render when the code is passed through filters.
+        parts = rendered.split(self.MARKER) if self.MARKER in rendered else None
+        path = getattr(template.origin, "name", None)
+        return template, parts, path, self._mtime(path)
+
+    def _is_stale(self, entry):
+        _, _, path, mtime = entry
+        return self._mtime(path) != mtime
+
+    @staticmethod
+    def _candidates(template_name, language):
+        base, extension = os.path.splitext(template_name)
+        languages = [language.lower()]
+        if "-" in language:
+            languages.append(language.split("-")[0].lower())
+        return [f"{base}.{lang}{extension}" for lang in languages] + [template_name]
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+
+email_templates = EmailTemplateCache()
+
+
+def _outbox_options():
+    options = {
+        "INLINE_DRAIN": True,
+        "LEASE": 60,
+        "MAX_ATTEMPTS": 8,
+        "BACKOFF_BASE": 30,
+        "BACKOFF_MAX": 3600,
+    }
+    options.update(getattr(settings, "EMAIL_OUTBOX", {}))
+    return options
+
+
+def queue_email(data):
+    # The outbox row is written in the caller's transaction; the message is only
+    # handed to the dispatcher once that transaction commits. Until the lease
+    # expires, drain_email_outbox leaves the row to the inline sender.
+    options = _outbox_options()
+    outbox = EmailOutbox.objects.create(
+        to_email=data['to_email'],
+        subject=data['subject'],
+        body=data['body'],
+        content_type=data.get('content_type', 'html'),
+        next_attempt_time=timezone.now() + timedelta(seconds=options["LEASE"]),
     )
-    Email.send_email(
+    if options["INLINE_DRAIN"]:
+        transaction.on_commit(lambda: _dispatch_outbox(outbox))
+    return outbox
+
+
+def queue_emails(data_list):
+    # Bulk variant for imports: rows are due immediately and left to
+    # drain_email_outbox instead of the in-process dispatcher.
+    now = timezone.now()
+    return EmailOutbox.objects.bulk_create(
+        [
+            EmailOutbox(
+                to_email=data['to_email'],
+                subject=data['subject'],
+                body=data['body'],
+                content_type=data.get('content_type', 'html'),
+                next_attempt_time=now,
+            )
+            for data in data_list
+        ]
+    )
+
+
+def _dispatch_outbox(outbox):
+    def mark_sent(email, failed):
+        if failed:
+            return
+        try:
+            EmailOutbox.objects.filter(id=outbox.id, status=EmailOutbox.PENDING).update(
+                status=EmailOutbox.SENT,
+                sent_time=timezone.now(),
+                attempts=F('attempts') + 1,
+            )
+        finally:
+            close_old_connections()
+
+    get_email_dispatcher().submit(_outbox_message(outbox), callback=mark_sent)
+
+
+def _outbox_message(outbox):
+    return Email.build_message(
         {
-            "subject": "Ro'yxatdan o'tish",
-            "to_email": email,
-            "body": html_content,
-            "content_type": "html"
+            "subject": outbox.subject,
+            "to_email": outbox.to_email,
+            "body": outbox.body,
+            "content_type": outbox.content_type,
         }
-    )
\ No newline at end of file
+    )
+
+
+def _retry_later(outbox, error, options):
+    outbox.attempts += 1
+    outbox.last_error = repr(error)
+    if outbox.attempts >= options["MAX_ATTEMPTS"]:
+        outbox.status = EmailOutbox.FAILED
+    else:
+        backoff = min(options["BACKOFF_BASE"] * 2 ** (outbox.attempts - 1), options["BACKOFF_MAX"])
+        outbox.next_attempt_time = timezone.now() + timedelta(seconds=backoff)
+
+
+def drain_outbox(batch_size=100):
+    # Claims due rows with SELECT ... FOR UPDATE SKIP LOCKED, so several drain
+    # processes can run side by side. Returns (sent, failed) for the batch.
+    # Failures, including an unreachable mail server, are recorded on the
+    # rows and retried with backoff rather than raised.
+    options = _outbox_options()
+    sent = failed = 0
+    with transaction.atomic():
+        rows = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailOutbox.PENDING, next_attempt_time__lte=timezone.now())
+            .order_by('next_attempt_time')[:batch_size]
+        )
+        if not rows:
+            return sent, failed
+        connection = None
+        started = time.monotonic()
+        try:
+            for index, outbox in enumerate(rows):
+                if connection is None:
+                    try:
+                        connection = get_connection()
+                        connection.open()
+                    except Exception as e:
+                        # Nothing else in the batch can be sent either.
+                        logger.warning("Opening the email connection failed: %r", e)
+                        for pending in rows[index:]:
+                            _retry_later(pending, e, options)
+                        failed += len(rows) - index
+                        break
+                try:
+                    connection.send_messages([_outbox_message(outbox)])
+                except Exception as e:
+                    failed += 1
+                    _retry_later(outbox, e, options)
+                    # A broken connection would fail the rest of the batch too.
+                    connection = EmailDispatcher._close(connection)
+                else:
+                    sent += 1
+                    outbox.attempts += 1
+                    outbox.status = EmailOutbox.SENT
+                    outbox.sent_time = timezone.now()
+        finally:
+            EmailDispatcher._close(connection)
+            email_send_latency.observe(time.monotonic() - started, "outbox")
+            emails_total.inc("outbox", "sent", amount=sent)
+            emails_total.inc("outbox", "failed", amount=failed)
+        EmailOutbox.objects.bulk_update(
+            rows,
+            ['attempts', 'status', 'sent_time', 'next_attempt_time', 'last_error']
+        )
+    return sent, failed
+
+
+def verification_email(email, code, language=None):
+    html_content = email_templates.render(
+        'email/authentication/activate_account.html',
+        code,
+        language
+    )
+    return {
+        "subject": "Ro'yxatdan o'tish",
+        "to_email": email,
+        "body": html_content,
+        "content_type": "html"
+    }
+
+
+def send_email(email, code, language=None):
+    return queue_email(verification_email(email, code, language))
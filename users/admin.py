@@ -1,9 +1,58 @@
 from django.contrib import admin
-from .models import User, UserConfirmation
+from django.db.models import Q
+from django.db.models.functions import Lower
+from shared.pagination import EstimatedCountPaginator
+from .exporter import export_rows, export_response
+from .models import User, UserConfirmation, UserImport
 
 # Register your models here.
 
 class UserModelAdmin(admin.ModelAdmin):
-    list_display = ['id', 'email', 'phone_number']
+    list_display = ['id', 'email', 'phone_number', 'username', 'auth_status', 'user_roles', 'created_time']
+    list_filter = ['auth_status', 'user_roles']
+    # Served backwards from the (created_time, id) and (<filter>, created_time, id) indexes.
+    ordering = ['-created_time', '-id']
+    search_fields = ['email', 'username']
+    search_help_text = "Email yoki username boshlanishi bo'yicha qidirish"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['export_csv', 'export_ndjson']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Prefix search on lower(email) / lower(username), which the
+        # text_pattern_ops expression indexes can serve, instead of the
+        # default UPPER(...) LIKE '%term%' full scans.
+        terms = search_term.lower().split()
+        if not terms:
+            return queryset, False
+        queryset = queryset.alias(email_lower=Lower('email'), username_lower=Lower('username'))
+        for term in terms:
+            queryset = queryset.filter(Q(email_lower__startswith=term) | Q(username_lower__startswith=term))
+        return queryset, False
+
+    @admin.action(description="Tanlangan foydalanuvchilarni CSV ga eksport qilish")
+    def export_csv(self, request, queryset):
+        return export_response(export_rows(queryset), 'csv')
+
+    @admin.action(description="Tanlangan foydalanuvchilarni NDJSON ga eksport qilish")
+    def export_ndjson(self, request, queryset):
+        return export_response(export_rows(queryset), 'ndjson')
 admin.site.register(User, UserModelAdmin)
-admin.site.register(UserConfirmation)
\ No newline at end of file
+
+
+class UserConfirmationAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'code', 'expiration_time', 'is_confirmed']
+    list_filter = ['is_confirmed']
+    # __str__ reads self.user
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+admin.site.register(UserConfirmation, UserConfirmationAdmin)
+
+class UserImportAdmin(admin.ModelAdmin):
+    list_display = ['id', 'file_format', 'status', 'created_by', 'created_time', 'updated_time']
+    list_filter = ['status']
+    list_select_related = ['created_by']
+    readonly_fields = ['result', 'error']
+admin.site.register(UserImport, UserImportAdmin)
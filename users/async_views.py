@@ -0,0 +1,281 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.contrib.auth.signals import user_login_failed
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views import View
+from rest_framework import exceptions, permissions, serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.settings import api_settings as drf_settings
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from shared.metrics import jwt_issued
+from shared.passwords import get_password_pool
+from shared.throttling import IPThrottle, AccountThrottle, EmailThrottle
+from shared.utility import send_email, check_user_type
+from .models import User, NEW, CODE_VERIFIED, DONE, PHOTO_DONE
+from .serializers import SignUpSerializer, LoginSerializer, LoginRefreshSerializer
+from .tokens import FilteredRefreshToken, aissue_tokens
+from .verification import get_code_backend
+from .views import fresh_user
+
+
+# Async versions of the signup -> verify -> login -> refresh endpoints for
+# the ASGI entry point (config/asgi.py). Queries use the async ORM; password
+# hashing runs in an executor, and everything else that may block (cache
+# backends, transactional writes, signal receivers) in sync_to_async hops.
+
+def serializer_error(detail):
+    # The shape a serializer's validate() error gets in a 400 response.
+    return ValidationError(serializers.as_serializer_error(ValidationError(detail)))
+
+
+class AsyncAPIView(View):
+    # The parts of DRF's APIView these views need. Parsing, authentication,
+    # permissions, throttling and error responses go through the same DRF
+    # classes as the sync endpoints, so both return the same responses.
+    authentication_classes = drf_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = (permissions.AllowAny, )
+    throttle_classes = ()
+    throttle_scope = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super(AsyncAPIView, cls).as_view(**initkwargs)
+        # Token authenticated API, like DRF's APIView.
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(
+            request,
+            parsers=[parser() for parser in drf_settings.DEFAULT_PARSER_CLASSES],
+            authenticators=[authentication() for authentication in self.authentication_classes],
+        )
+        self.request = request
+        try:
+            await sync_to_async(self.initial)(request)
+            return await super(AsyncAPIView, self).dispatch(request, *args, **kwargs)
+        except Exception as exc:
+            return self.handle_exception(exc)
+
+    def initial(self, request):
+        # APIView.initial(): the authenticators and throttles may query the
+        # database or the cache backend, so this runs in a sync_to_async hop.
+        request.user
+        for permission in self.permission_classes:
+            if not permission().has_permission(request, self):
+                if request.authenticators and not request.successful_authenticator:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied()
+        waits = []
+        for throttle in [throttle() for throttle in self.throttle_classes]:
+            if not throttle.allow_request(request, self):
+                waits.append(throttle.wait())
+        if waits:
+            raise exceptions.Throttled(max((wait for wait in waits if wait is not None), default=None))
+
+    def get_authenticate_header(self, request):
+        if request.authenticators:
+            return request.authenticators[0].authenticate_header(request)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            auth_header = self.get_authenticate_header(self.request)
+            if auth_header:
+                exc.auth_header = auth_header
+            else:
+                exc.status_code = 403
+        context = {'view': self, 'args': self.args, 'kwargs': self.kwargs, 'request': self.request}
+        response = drf_settings.EXCEPTION_HANDLER(exc, context)
+        if response is None:
+            raise exc
+        json_response = JsonResponse(response.data, status=response.status_code, safe=False)
+        for header in ('WWW-Authenticate', 'Retry-After'):
+            if response.has_header(header):
+                json_response[header] = response[header]
+        return json_response
+
+    @staticmethod
+    def get_data(request):
+        # What a serializer answers for a body that is not an object.
+        serializers.Serializer(data=request.data).is_valid(raise_exception=True)
+        return request.data
+
+    @staticmethod
+    async def run_in_executor(function, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+class AsyncCreateUserView(AsyncAPIView):
+    throttle_classes = (IPThrottle, EmailThrottle)
+    throttle_scope = 'signup'
+
+    async def post(self, request, *args, **kwargs):
+        serializer = SignUpSerializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        user = User(email=serializer.validated_data['email'])
+        user.check_pass()
+        user.password = await self.run_in_executor(get_password_pool().hash, user.password)
+        await sync_to_async(self.create_user)(user)
+        data = {"id": str(user.id), "auth_status": user.auth_status, "email": user.email}
+        data.update(await aissue_tokens(user))
+        return JsonResponse(data, status=201)
+
+    @staticmethod
+    def create_user(user):
+        with transaction.atomic():
+            user.save()
+            send_email(user.email, user.create_verify_code())
+
+
+class AsyncVerifyView(AsyncAPIView):
+    permission_classes = (permissions.IsAuthenticated, )
+
+    async def post(self, request, *args, **kwargs):
+        code = self.get_data(request).get('code')
+        user = await sync_to_async(fresh_user)(request)
+        if not await get_code_backend().averify(user, code):
+            raise ValidationError(
+                {
+                    "success": False,
+                    "message": "Tasdiqlash kodingiz xato yoki eskirgan."
+                }
+            )
+        if user.auth_status == NEW:
+            user.auth_status = CODE_VERIFIED
+            await sync_to_async(user.save)()
+        tokens = await aissue_tokens(user)
+        return JsonResponse(
+            {
+                "success": "True",
+                "auth_status": user.auth_status,
+                "access": tokens['access'],
+                "refresh": tokens['refresh_token']
+            }
+        )
+
+
+class AsyncNewVerificationView(AsyncAPIView):
+    permission_classes = (permissions.IsAuthenticated, )
+    throttle_classes = (IPThrottle, AccountThrottle)
+    throttle_scope = 'new_verify'
+
+    async def get(self, request, *args, **kwargs):
+        user = await sync_to_async(fresh_user)(request)
+        if await get_code_backend().ahas_active_code(user):
+            raise ValidationError(
+                {
+                    "success": False,
+                    "message": "Kodingiz hali ishlatish uchun yaroqli, iltimos kutib turing"
+                }
+            )
+        if not user.email:
+            raise ValidationError(
+                {
+                    "status": False,
+                    "message": "Email yoki telefon raqamingiz xato"
+                }
+            )
+        await sync_to_async(self.issue_code)(user)
+        return JsonResponse(
+            {
+                "success": True,
+                "message": "Tasdiqlash kodingiz qaytadan yuborildi."
+            }
+        )
+
+    @staticmethod
+    def issue_code(user):
+        with transaction.atomic():
+            send_email(user.email, user.create_verify_code())
+
+
+class AsyncLoginView(AsyncAPIView):
+    authentication_classes = ()
+    throttle_classes = (IPThrottle, AccountThrottle)
+    throttle_scope = 'login'
+
+    async def post(self, request, *args, **kwargs):
+        attrs = LoginSerializer().to_internal_value(request.data)
+        user_input = attrs['userinput']
+        try:
+            user_type = check_user_type(user_input=user_input)
+        except ValidationError as e:
+            raise serializer_error(e.detail)
+
+        users = [
+            user async for user in
+            User.objects.alias(lookup=Lower(user_type)).filter(lookup=user_input.lower())[:2]
+        ]
+        if len(users) > 1:
+            users = [user for user in users if getattr(user, user_type) == user_input]
+        user = users[0] if len(users) == 1 else None
+
+        if user is not None and user.auth_status in [NEW, CODE_VERIFIED]:
+            raise serializer_error(
+                {
+                    "success": False,
+                    "message": "Siz hali to'liq ro'yxatdan o'tmagansiz"
+                }
+            )
+        is_correct = False
+        if user is None:
+            # Hash anyway so unknown accounts take as long as wrong passwords.
+            await self.run_in_executor(get_password_pool().hash, attrs['password'])
+        else:
+            is_correct, must_update = await self.run_in_executor(
+                get_password_pool().verify, attrs['password'], user.password
+            )
+            if must_update:
+                # User.check_password() moves old hashes to the preferred hasher.
+                user.password = await self.run_in_executor(get_password_pool().hash, attrs['password'])
+                await sync_to_async(user.save)(update_fields=["password"])
+        if not is_correct or not user.is_active:
+            await sync_to_async(user_login_failed.send)(
+                sender=__name__,
+                credentials={LoginSerializer.username_field: user_input},
+                request=request
+            )
+            raise serializer_error(
+                {
+                    'success': False,
+                    'message': "Login yoki parol xato kiritildi, Iltimos tekshirib qaytadan kiriting!"
+                }
+            )
+        if user.auth_status not in [DONE, PHOTO_DONE]:
+            raise exceptions.PermissionDenied("Kechirasiz siz login qila olmaysiz. Ruxsatingiz yo'q!")
+
+        data = await aissue_tokens(user)
+        data['auth_status'] = user.auth_status
+        data['full_name'] = user.full_name
+        return JsonResponse(data)
+
+
+class AsyncLoginRefreshView(AsyncAPIView):
+    authentication_classes = ()
+
+    def get_authenticate_header(self, request):
+        # TokenViewBase.get_authenticate_header()
+        return f'{api_settings.AUTH_HEADER_TYPES[0]} realm="api"'
+
+    async def post(self, request, *args, **kwargs):
+        attrs = LoginRefreshSerializer().to_internal_value(request.data)
+        try:
+            # May confirm a blacklist hit against the database.
+            refresh = await sync_to_async(FilteredRefreshToken)(attrs['refresh'])
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        # update_last_login() and the active-user check in one statement
+        updated = await User.objects.filter(
+            id=refresh.payload.get(api_settings.USER_ID_CLAIM), is_active=True
+        ).aupdate(last_login=timezone.now())
+        if not updated:
+            raise exceptions.AuthenticationFailed(
+                LoginRefreshSerializer.default_error_messages["no_active_account"], "no_active_account"
+            )
+        jwt_issued.inc("access")
+        return JsonResponse({"access": str(refresh.access_token)})
@@ -0,0 +1,92 @@
+import copy
+import threading
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from shared.utility import TTLCache
+
+
+class UserCache:
+    # Users resolved from JWTs, keyed on user id. "django" keeps them in one
+    # of settings.CACHES, "local" in a per-process TTL/LRU cache. Entries are
+    # dropped when a user is saved or deleted (see users.signals); with the
+    # local backend other processes notice the change after TTL seconds.
+
+    def __init__(self, backend="django", ttl=60, max_size=10000, cache_alias="default"):
+        self.backend = backend
+        self.ttl = ttl
+        if backend == "local":
+            self.cache = TTLCache(max_size=max_size, ttl=ttl)
+        else:
+            self.cache = caches[cache_alias]
+
+    @staticmethod
+    def key(user_id):
+        return f"auth-user:{user_id}"
+
+    def get(self, user_id):
+        user = self.cache.get(self.key(user_id))
+        if user is not None and self.backend == "local":
+            # Views change request.user in place; never hand out the cached instance.
+            user = copy.copy(user)
+        return user
+
+    def set(self, user_id, user):
+        if self.backend == "local":
+            self.cache.set(self.key(user_id), copy.copy(user))
+        else:
+            self.cache.set(self.key(user_id), user, self.ttl)
+
+    def delete(self, user_id):
+        self.cache.delete(self.key(user_id))
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                options = getattr(settings, "AUTH_USER_CACHE", {})
+                _user_cache = UserCache(
+                    backend=options.get("BACKEND", "django"),
+                    ttl=options.get("TTL", 60),
+                    max_size=options.get("MAX_SIZE", 10000),
+                    cache_alias=options.get("CACHE", "default"),
+                )
+    return _user_cache
+
+
+def invalidate_user(user_id):
+    # For writes that bypass User.save(), e.g. QuerySet.update().
+    get_user_cache().delete(user_id)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    # JWTAuthentication that resolves the token's user through UserCache.
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+        user_cache = get_user_cache()
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+            return user
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if getattr(api_settings, "CHECK_REVOKE_TOKEN", False):
+            from rest_framework_simplejwt.utils import get_md5_hash_password
+
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
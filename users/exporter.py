@@ -0,0 +1,75 @@
+import csv
+import json
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .models import User
+
+EXPORT_FIELDS = ('id', 'email', 'username', 'auth_status', 'user_roles', 'created_time')
+PAGE_SIZE = 5000
+CHUNK_SIZE = 1000
+
+
+def export_rows(queryset=None, auth_status=None, created_from=None, created_to=None, page_size=PAGE_SIZE,
+                chunk_size=CHUNK_SIZE):
+    # Keyset pagination on (created_time, id): every page is an index range
+    # scan that starts where the previous one ended, so neither OFFSET nor one
+    # long-lived cursor is needed. Rows of a page are fetched with iterator()
+    # (a server-side cursor on PostgreSQL), which keeps memory flat.
+    queryset = User.objects.all() if queryset is None else queryset
+    if auth_status:
+        queryset = queryset.filter(auth_status=auth_status)
+    if created_from:
+        queryset = queryset.filter(created_time__gte=created_from)
+    if created_to:
+        queryset = queryset.filter(created_time__lt=created_to)
+    queryset = queryset.order_by('created_time', 'id').values_list(*EXPORT_FIELDS)
+
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(Q(created_time__gt=last[0]) | Q(created_time=last[0], id__gt=last[1]))
+        count = 0
+        for row in page[:page_size].iterator(chunk_size=chunk_size):
+            count += 1
+            last = (row[5], row[0])
+            yield row
+        if count < page_size:
+            break
+
+
+class Echo:
+    # File-like object for csv.writer that hands back what was written.
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([str(row[0]), *row[1:5], row[5].isoformat()])
+
+
+def render_ndjson(rows):
+    for row in rows:
+        record = dict(zip(EXPORT_FIELDS, row))
+        record['id'] = str(record['id'])
+        record['created_time'] = record['created_time'].isoformat()
+        yield json.dumps(record) + "\n"
+
+
+RENDERERS = {
+    'csv': (render_csv, 'text/csv'),
+    'ndjson': (render_ndjson, 'application/x-ndjson'),
+}
+
+
+def export_response(rows, file_format='csv'):
+    render, content_type = RENDERERS[file_format]
+    response = StreamingHttpResponse(render(rows), content_type=content_type)
+    filename = f"users-{timezone.now():%Y%m%d-%H%M%S}.{file_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,228 @@
+import csv
+import io
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from shared.media import stage_upload
+from shared.passwords import get_import_password_pool
+from shared.utility import email_regex, username_regex, queue_emails, verification_email
+from .models import User, UserImport, NEW, generate_usernames
+from .verification import get_code_backend
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+IMPORT_FIELDS = ('email', 'username', 'first_name', 'last_name', 'phone_number', 'password', 'auth_status',
+                 'user_roles')
+UNIQUE_FIELDS = ('email', 'username', 'phone_number')
+
+
+def read_records(stream, file_format):
+    # Yields (line number, record) from a binary stream; records that cannot
+    # be parsed come through as None.
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+    elif file_format == 'ndjson':
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f"Unknown import format: {file_format}")
+
+
+def guess_format(name):
+    return 'ndjson' if name.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+class UserImporter:
+    # Creates users in chunks: one existence query, one pass through the
+    # password pool and one bulk INSERT per chunk instead of the per-user
+    # signup path. Users without a password get an unusable one and are
+    # expected to go through forgot-password.
+
+    def __init__(self, chunk_size=CHUNK_SIZE, create_codes=False, send_emails=False, auth_status=NEW):
+        self.chunk_size = chunk_size
+        self.create_codes = create_codes or send_emails
+        self.send_emails = send_emails
+        self.auth_status = auth_status
+        self.result = {"created": 0, "skipped": 0, "invalid": 0, "errors": []}
+
+    def run(self, records):
+        chunk = []
+        for line_number, record in records:
+            user = self.build_user(line_number, record)
+            if user is None:
+                continue
+            chunk.append(user)
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        return self.result
+
+    def build_user(self, line_number, record):
+        if record is None:
+            return self.invalid(line_number, "Qatorni o'qib bo'lmadi")
+        data = {field: str(record.get(field) or '').strip() for field in IMPORT_FIELDS}
+        data['email'] = data['email'].lower()
+        if not email_regex.fullmatch(data['email']):
+            return self.invalid(line_number, "Email xato kiritildi")
+        if data['username'] and not username_regex.fullmatch(data['username']):
+            return self.invalid(line_number, "Username xato kiritildi")
+        if data['auth_status'] and data['auth_status'] not in dict(User.AUTH_STATUS):
+            return self.invalid(line_number, "auth_status xato kiritildi")
+        if data['user_roles'] and data['user_roles'] not in dict(User.USER_ROLES):
+            return self.invalid(line_number, "user_roles xato kiritildi")
+        user = User(
+            email=data['email'],
+            username=data['username'],
+            first_name=data['first_name'],
+            last_name=data['last_name'],
+            phone_number=data['phone_number'] or None,
+            password=data['password'],
+            auth_status=data['auth_status'] or self.auth_status,
+        )
+        if data['user_roles']:
+            user.user_roles = data['user_roles']
+        user._line_number = line_number
+        return user
+
+    def invalid(self, line_number, message):
+        self.result['invalid'] += 1
+        self.error(line_number, message)
+
+    def error(self, line_number, message):
+        if len(self.result['errors']) < MAX_REPORTED_ERRORS:
+            self.result['errors'].append({"line": line_number, "message": message})
+
+    def import_chunk(self, users):
+        users = self.drop_duplicates(users)
+        if not users:
+            return
+        self.prepare(users)
+        try:
+            self.insert(users)
+        except IntegrityError:
+            # Rows created concurrently since the existence check; check again.
+            users = self.drop_duplicates(users)
+            self.insert(users)
+        self.result['created'] += len(users)
+
+    def drop_duplicates(self, users):
+        # One query for the whole chunk; duplicates inside the chunk are caught by `seen`.
+        lookup = Q()
+        for field in UNIQUE_FIELDS:
+            values = {getattr(user, field) for user in users if getattr(user, field)}
+            if values:
+                lookup |= Q(**{f"{field}__in": values})
+        seen = {field: set() for field in UNIQUE_FIELDS}
+        taken = {field: set() for field in UNIQUE_FIELDS}
+        for row in User.objects.filter(lookup).values_list(*UNIQUE_FIELDS):
+            for field, value in zip(UNIQUE_FIELDS, row):
+                taken[field].add(value)
+
+        unique = []
+        for user in users:
+            values = {field: getattr(user, field) for field in UNIQUE_FIELDS if getattr(user, field)}
+            duplicate = next(
+                (field for field, value in values.items() if value in taken[field] or value in seen[field]), None
+            )
+            if duplicate:
+                self.result['skipped'] += 1
+                self.error(user._line_number, f"{duplicate} allaqachon olingan")
+                continue
+            for field, value in values.items():
+                seen[field].add(value)
+            unique.append(user)
+        return unique
+
+    def prepare(self, users):
+        # Usernames and password hashes are computed before the transaction.
+        missing = [user for user in users if not user.username]
+        for user, username in zip(missing, generate_usernames(len(missing))):
+            user.username = username
+
+        to_hash = []
+        for user in users:
+            if not user.password:
+                user.password = make_password(None)
+                continue
+            try:
+                identify_hasher(user.password)
+            except ValueError:
+                to_hash.append(user)
+        hashes = get_import_password_pool().hash_many([user.password for user in to_hash])
+        for user, encoded in zip(to_hash, hashes):
+            user.password = encoded
+
+    def insert(self, users):
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=self.chunk_size)
+            if self.create_codes:
+                codes = get_code_backend().issue_many(users)
+                if self.send_emails:
+                    queue_emails([verification_email(user.email, code) for user, code in zip(users, codes)])
+
+
+class ImportRunner:
+    # Runs ImportUsersView uploads one after another on a background thread,
+    # so an import holds neither a request worker nor the request's
+    # password hashing pool. Progress is kept on the UserImport row.
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-import")
+
+    def submit(self, job, upload, importer):
+        staged = stage_upload(upload)
+        # The job row has to be visible to the worker's connection first.
+        transaction.on_commit(lambda: self._executor.submit(self._run, job, staged, importer))
+
+    def _run(self, job, path, importer):
+        try:
+            UserImport.objects.filter(id=job.id).update(status=UserImport.RUNNING, updated_time=timezone.now())
+            with open(path, 'rb') as stream:
+                result = importer.run(read_records(stream, job.file_format))
+        except Exception as e:
+            logger.exception("User import %s failed", job.id)
+            UserImport.objects.filter(id=job.id).update(
+                status=UserImport.FAILED, error=repr(e), result=importer.result, updated_time=timezone.now()
+            )
+        else:
+            UserImport.objects.filter(id=job.id).update(
+                status=UserImport.DONE, result=result, updated_time=timezone.now()
+            )
+        finally:
+            os.unlink(path)
+            close_old_connections()
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_import_runner():
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = ImportRunner()
+    return _runner
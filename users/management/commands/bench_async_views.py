@@ -0,0 +1,75 @@
+import asyncio
+import json
+import time
+from django.core.management.base import BaseCommand
+from shared.benchmark import HttpConnection, run_load
+from users.models import User, DONE
+
+PASSWORD = "Bench-password-123"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load the sync (/users/) and async (/users/async/) auth endpoints of a running server, "
+        "e.g. `gunicorn config.wsgi` vs `uvicorn config.asgi:application`. "
+        "Start the server with THROTTLING_ENABLED=False against the same database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--prefixes', default='/users/,/users/async/')
+        parser.add_argument('--scenarios', default='refresh,login,signup')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        username = f"bench{time.time_ns()}"
+        user = User.objects.create(
+            email=f"{username}@example.com", username=username, password=PASSWORD, auth_status=DONE
+        )
+        try:
+            results = asyncio.run(self.run(options, username))
+        finally:
+            User.objects.filter(email__startswith=username).delete()
+            user.delete()
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results:
+            self.stdout.write(
+                "{prefix:<16} {scenario:<8} {throughput:8.1f} req/s  p50={p50_ms:.1f}ms "
+                "p95={p95_ms:.1f}ms p99={p99_ms:.1f}ms errors={errors}".format(**row)
+            )
+
+    async def run(self, options, username):
+        connection = HttpConnection(options['base_url'])
+        status, _, content = await connection.request(
+            'POST', '/users/login/', {"userinput": username, "password": PASSWORD}
+        )
+        await connection.close()
+        if status != 200:
+            raise RuntimeError(f"Login failed with {status}: {content[:200]}")
+        refresh_token = json.loads(content)['refresh_token']
+
+        scenarios = {
+            "refresh": lambda prefix: lambda conn, index: self.call(
+                conn, 'POST', f"{prefix}login/refresh/", {"refresh": refresh_token}),
+            "login": lambda prefix: lambda conn, index: self.call(
+                conn, 'POST', f"{prefix}login/", {"userinput": username, "password": PASSWORD}),
+            "signup": lambda prefix: lambda conn, index: self.call(
+                conn, 'POST', f"{prefix}signup/", {"email": f"{username}-{prefix.strip('/').replace('/', '-')}-{index}@example.com"}),
+        }
+        results = []
+        for scenario in options['scenarios'].split(','):
+            for prefix in options['prefixes'].split(','):
+                summary = await run_load(
+                    options['base_url'], scenarios[scenario](prefix), options['requests'], options['concurrency']
+                )
+                results.append({"prefix": prefix, "scenario": scenario, **summary})
+        return results
+
+    @staticmethod
+    async def call(connection, method, path, body):
+        status, _, _ = await connection.request(method, path, body)
+        return status
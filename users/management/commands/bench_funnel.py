@@ -0,0 +1,214 @@
+import json
+import re
+import resource
+import subprocess
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core import mail
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+from shared.benchmark import percentile
+from shared.metrics import QueryTimer
+from users.models import User
+from users.photos import get_photo_processor, photo_variants
+
+STEPS = ('signup', 'verify', 'change-user', 'change-photo', 'login', 'login-refresh', 'logout')
+PASSWORD = "Bench-password-123"
+code_regex = re.compile(r"<b>(\d{4})</b>")
+
+
+class CodeInbox:
+    # Reads verification codes out of the locmem backend's mail.outbox,
+    # which the email dispatcher threads append to.
+
+    def __init__(self):
+        self.codes = {}
+        self.seen = 0
+        self.lock = threading.Lock()
+
+    def wait(self, email, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                for message in mail.outbox[self.seen:]:
+                    match = code_regex.search(message.body)
+                    if match:
+                        self.codes[message.to[0]] = match.group(1)
+                self.seen = len(mail.outbox)
+                if email in self.codes:
+                    return self.codes.pop(email)
+            time.sleep(0.005)
+        raise TimeoutError(f"No verification email for {email}")
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the signup -> verify -> change-user -> change-photo -> login -> login/refresh -> logout "
+        "funnel in-process against the configured database, with the locmem email backend, and "
+        "report latency percentiles, throughput, queries per step and peak memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help="Funnels to run.")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--tracemalloc', action='store_true',
+                            help="Also report the peak of Python allocations (slows the run down).")
+        parser.add_argument('--output', default=None, help="Write the JSON report to this file.")
+        parser.add_argument('--keep-users', action='store_true')
+
+    def handle(self, *args, **options):
+        self.prefix = f"funnel{uuid.uuid4().hex[:8]}"
+        self.inbox = CodeInbox()
+        self.samples = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.first_errors = {}
+        self.lock = threading.Lock()
+        self.photo = self.make_photo()
+        mail.outbox = []
+
+        throttling = {**getattr(settings, 'THROTTLING', {}), "ENABLED": False}
+        overrides = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            THROTTLING=throttling,
+            ALLOWED_HOSTS=['testserver'],
+        )
+        if options['tracemalloc']:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with overrides:
+            try:
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                    completed = sum(executor.map(self.run_funnel, range(options['users'])))
+            finally:
+                # Let queued photo jobs finish before their users go away.
+                get_photo_processor().shutdown()
+                if not options['keep_users']:
+                    self.delete_users()
+        elapsed = time.perf_counter() - started
+
+        report = self.report(options, completed, elapsed)
+        if options['tracemalloc']:
+            report['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + "\n")
+        self.stdout.write(output)
+
+    def delete_users(self):
+        users = User.objects.filter(email__startswith=self.prefix)
+        for name in users.exclude(photo='').values_list('photo', flat=True):
+            for variant in photo_variants(name).values():
+                default_storage.delete(variant)
+        users.delete()
+
+    @staticmethod
+    def make_photo():
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 1200), (120, 80, 200)).save(buffer, 'JPEG', quality=90)
+        return buffer.getvalue()
+
+    def run_funnel(self, index):
+        client = Client()
+        email = f"{self.prefix}-{index}@example.com"
+        username = f"{self.prefix}u{index}"
+        try:
+            data = self.step('signup', 201, client.post, '/users/signup/', {"email": email})
+            auth = {"HTTP_AUTHORIZATION": f"Bearer {data['access']}"}
+            code = self.inbox.wait(email)
+            data = self.step('verify', 200, client.post, '/users/verify/', {"code": code}, **auth)
+            auth = {"HTTP_AUTHORIZATION": f"Bearer {data['access']}"}
+            self.step(
+                'change-user', 200, client.put, '/users/change-user/',
+                {
+                    "first_name": "Benchmark",
+                    "last_name": "Funnelov",
+                    "username": username,
+                    "password": PASSWORD,
+                    "confirm_password": PASSWORD,
+                },
+                content_type='application/json', **auth
+            )
+            photo = BytesIO(self.photo)
+            photo.name = 'photo.jpg'
+            self.step(
+                'change-photo', 202, client.put, '/users/change-photo/',
+                encode_multipart(BOUNDARY, {"photo": photo}), content_type=MULTIPART_CONTENT, **auth
+            )
+            data = self.step('login', 200, client.post, '/users/login/', {"userinput": username, "password": PASSWORD})
+            auth = {"HTTP_AUTHORIZATION": f"Bearer {data['access']}"}
+            refresh = data['refresh_token']
+            self.step('login-refresh', 200, client.post, '/users/login/refresh/', {"refresh": refresh})
+            self.step('logout', 205, client.post, '/users/logout/', {"refresh": refresh}, **auth)
+        except (StepFailed, TimeoutError):
+            return 0
+        finally:
+            close_old_connections()
+        return 1
+
+    def step(self, name, expected_status, method, path, data, **extra):
+        queries = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = method(path, data, **extra)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            if response.status_code != expected_status:
+                self.errors[name] += 1
+                self.first_errors.setdefault(name, f"{response.status_code} {response.content[:300].decode(errors='replace')}")
+                raise StepFailed(name)
+            self.samples[name].append((elapsed, queries.count))
+        return response.json() if response.content else {}
+
+    def report(self, options, completed, elapsed):
+        steps = {}
+        for name in STEPS:
+            latencies = [latency for latency, _ in self.samples[name]]
+            queries = [count for _, count in self.samples[name]]
+            steps[name] = {
+                "requests": len(latencies),
+                "errors": self.errors[name],
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "queries_avg": sum(queries) / len(queries) if queries else 0,
+                "queries_max": max(queries, default=0),
+            }
+            if name in self.first_errors:
+                steps[name]["first_error"] = self.first_errors[name]
+        return {
+            "commit": self.git_commit(),
+            "database": connection.vendor,
+            "users": options['users'],
+            "concurrency": options['concurrency'],
+            "completed_funnels": completed,
+            "elapsed_s": elapsed,
+            "funnels_per_second": completed / elapsed if elapsed else 0,
+            "requests_per_second": sum(len(samples) for samples in self.samples.values()) / elapsed if elapsed else 0,
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "steps": steps,
+        }
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True
+            ).stdout.strip() or None
+        except OSError:
+            return None
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from shared.benchmark import run_load
+from users.models import User, PHOTO_DONE
+from users.photos import PHOTO_DIR
+from users.tokens import issue_tokens
+
+
+def rss_kb(pid):
+    # Resident set size of a process and its children (gunicorn workers).
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as children:
+            pids += [int(child) for child in children.read().split()]
+    except OSError:
+        pass
+    for process in pids:
+        try:
+            with open(f"/proc/{process}/status") as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        "Load GET /users/photos/<name> of a running server with a large file and report throughput, "
+        "latency and, with --server-pid, the server's peak RSS. Run it once per PROTECTED_MEDIA_BACKEND."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--size-mb', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--range', default=None, help="Send this Range header, e.g. bytes=0-1048575.")
+        parser.add_argument('--server-pid', type=int, default=None)
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        name = f"bench/{options['size_mb']}mb.bin"
+        path = os.path.join(settings.MEDIA_ROOT, PHOTO_DIR, name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                for _ in range(options['size_mb']):
+                    file.write(os.urandom(1024 * 1024))
+        username = f"bench{time.time_ns()}"
+        user = User.objects.create(email=f"{username}@example.com", username=username, auth_status=PHOTO_DONE)
+        headers = {"Authorization": f"Bearer {issue_tokens(user)['access']}"}
+        if options['range']:
+            headers['Range'] = options['range']
+
+        peak = 0
+        done = threading.Event()
+
+        def sample():
+            nonlocal peak
+            while not done.wait(0.05):
+                peak = max(peak, rss_kb(options['server_pid']))
+
+        if options['server_pid']:
+            baseline = rss_kb(options['server_pid'])
+            threading.Thread(target=sample, daemon=True).start()
+        received = 0
+
+        async def fetch(connection, index):
+            nonlocal received
+            status, _, content = await connection.request('GET', f"/users/photos/{name}", headers=headers)
+            received += len(content)
+            return status
+
+        started = time.perf_counter()
+        try:
+            result = asyncio.run(run_load(options['base_url'], fetch, options['requests'], options['concurrency']))
+        finally:
+            done.set()
+            user.delete()
+        elapsed = time.perf_counter() - started
+        result['megabytes_per_second'] = received / elapsed / 1024 / 1024
+        if options['server_pid']:
+            result['server_rss_baseline_mb'] = baseline / 1024
+            result['server_rss_peak_mb'] = peak / 1024
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        for key, value in result.items():
+            self.stdout.write(f"{key:<24} {value:.1f}" if isinstance(value, float) else f"{key:<24} {value}")
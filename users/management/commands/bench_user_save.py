@@ -0,0 +1,58 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from users.models import User, DONE
+from users.verification import get_code_backend
+
+
+class Command(BaseCommand):
+    help = "Report SQL query counts and latency of the verify and token refresh flows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        setup_test_environment()
+        users = []
+        try:
+            results = {"verify": [], "refresh": []}
+            for index in range(options['iterations']):
+                user = User.objects.create(email=f"bench-save-{index}-{time.time_ns()}@example.com")
+                users.append(user)
+                client = Client()
+                tokens = user.token()
+                code = get_code_backend().issue(user)
+                results["verify"].append(self.measure(
+                    client.post, '/users/verify/', {"code": code},
+                    HTTP_AUTHORIZATION=f"Bearer {tokens['access']}",
+                ))
+                User.objects.filter(id=user.id).update(auth_status=DONE)
+                results["refresh"].append(self.measure(
+                    client.post, '/users/login/refresh/', {"refresh": tokens['refresh_token']},
+                ))
+            for flow, samples in results.items():
+                queries = [count for count, _ in samples]
+                latencies = [elapsed for _, elapsed in samples]
+                self.stdout.write(
+                    f"{flow:<8} queries={statistics.mean(queries):.1f} "
+                    f"latency p50={statistics.median(latencies):.2f}ms mean={statistics.mean(latencies):.2f}ms"
+                )
+        finally:
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+            teardown_test_environment()
+
+    def measure(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = method(*args, **kwargs)
+            elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            self.stderr.write(f"{args[0]} -> {response.status_code}: {response.content[:200]}")
+        if self.verbosity > 1:
+            for query in queries.captured_queries:
+                self.stdout.write(f"  {query['sql'][:160]}")
+        return len(queries), elapsed
@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from users.models import User, UserConfirmation
+from users.verification import DatabaseCodeBackend
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed UserConfirmation rows and compare verify latency with and without the "
+        "verification code indexes. Run it against a disposable PostgreSQL database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000)
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--samples', type=int, default=500)
+        parser.add_argument('--skip-seed', action='store_true')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("This benchmark needs PostgreSQL.")
+        if not options['skip_seed']:
+            self.seed(options['users'], options['rows'])
+        user_ids = list(
+            User.objects.filter(username__startswith='bench-').values_list('id', flat=True)[:options['samples'] * 10]
+        )
+        users = [User(id=user_id) for user_id in random.sample(user_ids, min(options['samples'], len(user_ids)))]
+
+        with transaction.atomic():
+            # DDL is transactional in PostgreSQL: drop the indexes, measure, roll back.
+            with connection.schema_editor() as editor:
+                for index in UserConfirmation._meta.indexes:
+                    editor.remove_index(UserConfirmation, index)
+            self.report("without indexes", self.measure(users))
+            transaction.set_rollback(True)
+        self.report("with indexes", self.measure(users))
+
+    def seed(self, user_count, row_count):
+        self.stdout.write(f"Seeding {user_count} users and {row_count} verification codes...")
+        batch = 10_000
+        for start in range(0, user_count, batch):
+            User.objects.bulk_create(
+                [
+                    User(username=f"bench-{i}", email=f"bench-{i}@example.com", password="!")
+                    for i in range(start, min(start + batch, user_count))
+                ],
+                ignore_conflicts=True,
+            )
+        with connection.cursor() as cursor:
+            # 90% of the codes are expired or confirmed, like a table that is never purged.
+            cursor.execute(
+                f"""
+                WITH bench_users AS (
+                    SELECT array_agg(id) AS ids FROM {User._meta.db_table} WHERE username LIKE 'bench-%%'
+                )
+                INSERT INTO {UserConfirmation._meta.db_table}
+                    (id, created_time, updated_time, code, user_id, expiration_time, is_confirmed)
+                SELECT gen_random_uuid(), now(), now(), lpad((random() * 9999)::int::text, 4, '0'),
+                       ids[1 + (g %% array_length(ids, 1))],
+                       now() + (random() * interval '5 minutes') - (random() * interval '30 days'),
+                       random() < 0.5
+                FROM generate_series(1, %s) AS g, bench_users
+                """,
+                [row_count],
+            )
+            cursor.execute(f"ANALYZE {UserConfirmation._meta.db_table}")
+
+    @staticmethod
+    def measure(users):
+        backend = DatabaseCodeBackend()
+        timings = []
+        for user in users:
+            started = time.perf_counter()
+            with transaction.atomic():
+                backend.has_active_code(user)
+                backend.verify(user, "0000")
+                transaction.set_rollback(True)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def report(self, label, timings):
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:<16} p50={statistics.median(timings):.2f}ms p95={p95:.2f}ms max={timings[-1]:.2f}ms"
+        )
@@ -0,0 +1,43 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from users.importer import UserImporter, read_records, guess_format, CHUNK_SIZE
+from users.models import User, NEW
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk create users from a CSV or NDJSON file with the columns email, username, first_name, "
+        "last_name, phone_number, password, auth_status and user_roles (only email is required)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default=None,
+                            help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--auth-status', choices=[status for status, _ in User.AUTH_STATUS], default=NEW,
+                            help="For rows without an auth_status column.")
+        parser.add_argument('--create-codes', action='store_true', help="Issue a verification code per user.")
+        parser.add_argument('--send-emails', action='store_true',
+                            help="Queue verification emails in the outbox (implies --create-codes).")
+
+    def handle(self, *args, **options):
+        importer = UserImporter(
+            chunk_size=options['chunk_size'],
+            create_codes=options['create_codes'],
+            send_emails=options['send_emails'],
+            auth_status=options['auth_status'],
+        )
+        started = time.perf_counter()
+        with open(options['path'], 'rb') as stream:
+            result = importer.run(read_records(stream, options['format'] or guess_format(options['path'])))
+        elapsed = time.perf_counter() - started
+        for error in result['errors']:
+            self.stderr.write(json.dumps(error, ensure_ascii=False))
+        self.stdout.write(
+            "Created {created}, skipped {skipped} existing, {invalid} invalid".format(**result)
+            + f" ({elapsed:.1f}s, {result['created'] / elapsed if elapsed else 0:.0f} users/s)"
+        )
+        if options['send_emails'] and result['created']:
+            self.stdout.write("Emails are queued; run drain_email_outbox to send them.")
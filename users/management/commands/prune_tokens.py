@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from users.tokens import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding and blacklisted JWT refresh tokens in bounded batches. "
+        "Schedule it from cron, or keep it running with --every."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--pause', type=float, default=0.1, help="Seconds to sleep between batches.")
+        parser.add_argument('--time-budget', type=float, default=None, help="Stop a run after this many seconds.")
+        parser.add_argument('--every', type=float, default=None, help="Repeat the run every N seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            result = prune_expired_tokens(
+                batch_size=options['batch_size'],
+                pause=options['pause'],
+                time_budget=options['time_budget'],
+            )
+            self.stdout.write(
+                "Removed {outstanding_removed} outstanding and {blacklisted_removed} blacklisted tokens "
+                "in {batches} batches ({elapsed:.1f}s, {rows_per_second:.0f} rows/s)".format(**result)
+            )
+            if options['every'] is None:
+                break
+            time.sleep(options['every'])
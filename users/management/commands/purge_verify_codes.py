@@ -0,0 +1,39 @@
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand
+from users.models import UserConfirmation
+
+
+class Command(BaseCommand):
+    help = "Delete expired and confirmed verification codes in small chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0.05, help="Seconds to pause between chunks.")
+        parser.add_argument('--max-chunks', type=int, default=None)
+
+    def handle(self, *args, **options):
+        now = datetime.now()
+        # Both filters are range scans on verify_code_expiration_idx; confirmed
+        # codes that have not expired yet are at most a few minutes old.
+        querysets = [
+            UserConfirmation.objects.filter(expiration_time__lt=now),
+            UserConfirmation.objects.filter(expiration_time__gte=now, is_confirmed=True),
+        ]
+        deleted = chunks = 0
+        started = time.monotonic()
+        for queryset in querysets:
+            while options['max_chunks'] is None or chunks < options['max_chunks']:
+                ids = list(queryset.values_list('id', flat=True)[:options['chunk_size']])
+                if not ids:
+                    break
+                # Each chunk is its own short transaction, so row locks are held briefly.
+                count, _ = UserConfirmation.objects.filter(id__in=ids).delete()
+                deleted += count
+                chunks += 1
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} verification codes in {chunks} chunks ({elapsed:.1f}s)")
+        )
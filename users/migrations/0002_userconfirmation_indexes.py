@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:38
+
+from shared.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='userconfirmation',
+            index=models.Index(condition=models.Q(('is_confirmed', False)), fields=['user', 'expiration_time'], name='verify_code_active_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='userconfirmation',
+            index=models.Index(fields=['expiration_time'], name='verify_code_expiration_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+from shared.operations import PostgresRunSQL
+
+
+class Migration(migrations.Migration):
+    # token_blacklist does not index expires_at; prune_tokens deletes in
+    # expires_at order, so each batch needs an index range scan.
+    atomic = False
+
+    dependencies = [
+        ('users', '0002_userconfirmation_indexes'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        PostgresRunSQL(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS outstanding_token_expires_idx "
+            "ON token_blacklist_outstandingtoken (expires_at);",
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS outstanding_token_expires_idx;",
+        ),
+    ]
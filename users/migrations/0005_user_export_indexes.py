@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:50
+
+from shared.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0004_user_lower_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(fields=['created_time', 'id'], name='user_created_keyset_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(fields=['auth_status', 'created_time', 'id'], name='user_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:51
+
+from django.db import migrations, models
+from shared.operations import AddIndexConcurrently, PostgresRunSQL
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0005_user_export_indexes'),
+    ]
+
+    # text_pattern_ops variants of the lower() indexes from 0004, for the
+    # admin prefix search; the plain ones stay for the login lookups on every
+    # backend. Operator classes are PostgreSQL-only, so these two live in SQL
+    # rather than in User.Meta.indexes, which every backend has to be able to
+    # create.
+    operations = [
+        PostgresRunSQL(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS user_email_prefix_idx "
+            "ON users_user (lower(email) text_pattern_ops);",
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS user_email_prefix_idx;",
+        ),
+        PostgresRunSQL(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS user_username_prefix_idx "
+            "ON users_user (lower(username) text_pattern_ops);",
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS user_username_prefix_idx;",
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(fields=['user_roles', 'created_time', 'id'], name='user_roles_created_idx'),
+        ),
+    ]
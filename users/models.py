@@ -1,17 +1,36 @@
-import random
 import uuid
 from datetime import datetime, timedelta
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Lower
 from shared.models import BaseModel
+from shared.passwords import get_password_pool
+from django.contrib.auth.hashers import identify_hasher
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import FileExtensionValidator
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import issue_tokens
+from .verification import get_code_backend
 
 
 # Create your models here.
 ORDINARY_USER, MANAGER, ADMIN = ('ordinary_user', 'manager', 'admin')
 VIA_EMAIL = 'via_email'
 NEW, CODE_VERIFIED, DONE, PHOTO_DONE = ('new', 'code_verified', 'done', 'photo_done')
+USERNAME_ATTEMPTS = 3
+
+
+def random_username():
+    return f"instagram-{uuid.uuid4().hex[-12:]}"
+
+
+def generate_usernames(count):
+    # For bulk creation: candidates are checked against the table in one
+    # username__in query per round instead of one query per name.
+    usernames = set()
+    while len(usernames) < count:
+        candidates = {random_username() for _ in range(count - len(usernames))}
+        taken = set(User.objects.filter(username__in=candidates).values_list('username', flat=True))
+        usernames |= candidates - taken
+    return list(usernames)
 
 
 class User(AbstractUser, BaseModel):
@@ -40,12 +59,27 @@ class User(AbstractUser, BaseModel):
                 allowed_extensions=[
                     'jpg',
                     'jpeg',
-                    'png'
+                    'png',
+                    'webp'
                 ]
             )
         ]
     )
 
+    class Meta(AbstractUser.Meta):
+        # Login looks users up by lower(email) / lower(username). Exports and
+        # the admin changelist page through (created_time, id), optionally
+        # within one auth_status or user_roles value. The text_pattern_ops
+        # variants of the lower() indexes, for the admin prefix search, are
+        # PostgreSQL-only and are created in migration 0006.
+        indexes = [
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+            models.Index(Lower('username'), name='user_username_lower_idx'),
+            models.Index(fields=['created_time', 'id'], name='user_created_keyset_idx'),
+            models.Index(fields=['auth_status', 'created_time', 'id'], name='user_status_created_idx'),
+            models.Index(fields=['user_roles', 'created_time', 'id'], name='user_roles_created_idx'),
+        ]
+
 
     def __str__(self) -> str:
         return self.username
@@ -57,19 +91,14 @@ class User(AbstractUser, BaseModel):
     
 
     def create_verify_code(self):
-        code = "".join([str(random.randint(0, 10000) % 10) for _ in range(4)])
-        UserConfirmation.objects.create(
-            user_id=self.id,
-            code=code,
-        )
-        return code
+        return get_code_backend().issue(self)
     
     def check_username(self):
+        # 48 random bits per name make collisions practically impossible, so
+        # there is no pre-check; save() retries if the insert still collides.
         if not self.username:
-            temp_username = f"instagram-{uuid.uuid4().__str__().split('-')[-1]}"
-            while User.objects.filter(username=temp_username):
-                temp_username = f"{temp_username}{random.randint(0,9)}"
-            self.username = temp_username
+            self.username = random_username()
+            self._username_generated = True
 
     def check_email(self):
         if not self.email:
@@ -82,25 +111,56 @@ class User(AbstractUser, BaseModel):
             self.password = temp_password
 
     def hashing_password(self):
-        if not self.password.startswith("pbkdf2_sha256"):
+        try:
+            identify_hasher(self.password)
+        except ValueError:
             self.set_password(self.password)
 
+    def set_password(self, raw_password):
+        self.password = get_password_pool().hash(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        is_correct, must_update = get_password_pool().verify(raw_password, self.password)
+        if must_update:
+            # Transparently move old hashes to the preferred hasher on login.
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=["password"])
+        return is_correct
+
     def token(self):
-        refresh = RefreshToken().for_user(self)
-        return {
-            "access": str(refresh.access_token),
-            "refresh_token": str(refresh)
-        }
+        return issue_tokens(self)
     
     def save(self, *args, **kwargs):
-        self.clean()
-        super(User, self).save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self.normalize(update_fields if update_fields is not None else self.get_dirty_fields())
+        if not getattr(self, '_username_generated', False):
+            return super(User, self).save(*args, **kwargs)
+        for attempt in range(USERNAME_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    super(User, self).save(*args, **kwargs)
+                break
+            except IntegrityError:
+                last_attempt = attempt == USERNAME_ATTEMPTS - 1
+                if last_attempt or not User.objects.filter(username=self.username).exists():
+                    raise
+                self.username = random_username()
+        self._username_generated = False
 
     def clean(self) -> None:
-        self.check_email()
-        self.check_username()
-        self.check_pass()
-        self.hashing_password()
+        self.normalize()
+
+    def normalize(self, fields=None):
+        # Runs only the steps for the given fields (all of them when None).
+        if fields is None or 'email' in fields:
+            self.check_email()
+        if fields is None or 'username' in fields:
+            self.check_username()
+        if fields is None or 'password' in fields:
+            self.check_pass()
+            self.hashing_password()
 
 
 
@@ -110,6 +170,16 @@ class UserConfirmation(BaseModel):
     expiration_time = models.DateTimeField(null=True)
     is_confirmed = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'expiration_time'],
+                condition=models.Q(is_confirmed=False),
+                name='verify_code_active_idx'
+            ),
+            models.Index(fields=['expiration_time'], name='verify_code_expiration_idx'),
+        ]
+
 
     def __str__(self) -> str:
         return str(self.user.__str__())
@@ -118,3 +188,22 @@ class UserConfirmation(BaseModel):
     def save(self, *args, **kwargs):
         self.expiration_time = datetime.now() + timedelta(minutes=5)
         super(UserConfirmation, self).save(*args, **kwargs)
+
+
+class UserImport(BaseModel):
+    # One upload to ImportUsersView, processed in the background by users.importer.ImportRunner.
+    PENDING, RUNNING, DONE, FAILED = ('pending', 'running', 'done', 'failed')
+    STATUSES = (
+        (PENDING, PENDING),
+        (RUNNING, RUNNING),
+        (DONE, DONE),
+        (FAILED, FAILED)
+    )
+    created_by = models.ForeignKey("users.User", models.SET_NULL, null=True, related_name="imports")
+    file_format = models.CharField(max_length=16)
+    status = models.CharField(max_length=16, choices=STATUSES, default=PENDING)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.file_format} import ({self.status})"
@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.db import close_old_connections
+from django.db.models import Case, F, Q, Value, When
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework.exceptions import Throttled, ValidationError
+from shared.media import stage_upload
+from .authentication import invalidate_user
+from .models import User, DONE, PHOTO_DONE
+
+logger = logging.getLogger(__name__)
+
+PHOTO_DIR = 'user_photos'
+ALLOWED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+
+def _options():
+    options = {
+        "MAX_SIZE": 10 * 1024 * 1024,
+        "MAX_PIXELS": 40_000_000,
+        "SIZES": (1080, 320, 150),
+        "QUALITY": 80,
+        "WORKERS": 2,
+        "QUEUE_SIZE": 100,
+    }
+    options.update(getattr(settings, "USER_PHOTOS", {}))
+    return options
+
+
+class PhotoUploadHandler(TemporaryFileUploadHandler):
+    # Always spools the upload to a temporary file and stops reading it once
+    # MAX_SIZE bytes have arrived, instead of buffering it in memory first.
+
+    def __init__(self, *args, **kwargs):
+        super(PhotoUploadHandler, self).__init__(*args, **kwargs)
+        self.max_size = _options()["MAX_SIZE"]
+        self.received = 0
+        self.too_large = False
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # The multipart body can't be smaller than the file in it; returning
+        # empty data here skips parsing (and reading) the body altogether.
+        if content_length > self.max_size + 64 * 1024:
+            self.too_large = True
+            return QueryDict(encoding=encoding), MultiValueDict()
+
+    def new_file(self, *args, **kwargs):
+        self.received = 0
+        super(PhotoUploadHandler, self).new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.too_large = True
+            self.file.close()
+            raise SkipFile()
+        return super(PhotoUploadHandler, self).receive_data_chunk(raw_data, start)
+
+
+def inspect_image(upload):
+    # Image.open() only parses the header, so the format and dimensions are
+    # checked without decoding any pixel data.
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            image_format, (width, height) = image.format, image.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ValidationError({"success": False, "message": "Yuborilgan fayl rasm emas yoki buzilgan"})
+    finally:
+        upload.seek(0)
+    if image_format not in ALLOWED_FORMATS:
+        raise ValidationError({"success": False, "message": "Rasm formati jpg, png yoki webp bo'lishi kerak"})
+    if width * height > _options()["MAX_PIXELS"]:
+        raise ValidationError({"success": False, "message": "Rasm o'lchami juda katta"})
+    return image_format
+
+
+def photo_name(user_id, token, size):
+    return f"{PHOTO_DIR}/{user_id}/{token}-{size}.webp"
+
+
+def photo_variants(name):
+    # The derivatives of one upload share a prefix; User.photo holds the largest.
+    if not name:
+        return {}
+    prefix = name.rsplit('-', 1)[0]
+    return {size: f"{prefix}-{size}.webp" for size in _options()["SIZES"]}
+
+
+def is_user_photo(name):
+    # Only files that are some user's current photo (or one of its
+    # derivatives) are served; leftovers and anything else under PHOTO_DIR are not.
+    return User.objects.filter(Q(photo=name) | Q(photo__in=photo_variants(name).values())).exists()
+
+
+def render_variants(path, sizes, quality):
+    with Image.open(path) as image:
+        largest = max(sizes)
+        # JPEG can be decoded straight at a reduced scale.
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for size in sorted(sizes, reverse=True):
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            image.save(buffer, 'WEBP', quality=quality, method=4)
+            yield size, buffer.getvalue()
+
+
+class PhotoProcessor:
+    # Resizes uploads in a small thread pool (Pillow releases the GIL while
+    # decoding, resampling and encoding). At most QUEUE_SIZE uploads wait or
+    # run at once; further uploads get 429 Throttled.
+
+    def __init__(self, workers=2, queue_size=100, sizes=(1080, 320, 150), quality=80):
+        self.sizes = tuple(sizes)
+        self.quality = quality
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photo-processor")
+
+    def submit(self, user_id, upload):
+        if not self._slots.acquire(blocking=False):
+            raise Throttled(detail="Server band, iltimos birozdan keyin qayta urinib ko'ring.")
+        try:
+            staged = stage_upload(upload)
+        except BaseException:
+            self._slots.release()
+            raise
+        return self._executor.submit(self._process, user_id, staged)
+
+    def _process(self, user_id, path):
+        try:
+            self.process(user_id, path)
+        except Exception:
+            logger.exception("Processing the photo of user %s failed", user_id)
+        finally:
+            os.unlink(path)
+            self._slots.release()
+            close_old_connections()
+
+    def process(self, user_id, path):
+        token = uuid.uuid4().hex[:12]
+        names = []
+        for size, content in render_variants(path, self.sizes, self.quality):
+            names.append(default_storage.save(photo_name(user_id, token, size), ContentFile(content)))
+        previous = User.objects.filter(id=user_id).values_list('photo', flat=True).first()
+        # PHOTO_DONE is only set once the files exist, and only from DONE.
+        User.objects.filter(id=user_id).update(
+            photo=names[0],
+            auth_status=Case(When(auth_status=DONE, then=Value(PHOTO_DONE)), default=F('auth_status')),
+            updated_time=timezone.now(),
+        )
+        invalidate_user(user_id)
+        if previous and previous.startswith(f"{PHOTO_DIR}/{user_id}/"):
+            for name in photo_variants(previous).values():
+                default_storage.delete(name)
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+_processor = None
+_processor_lock = threading.Lock()
+
+
+def get_photo_processor():
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                options = _options()
+                _processor = PhotoProcessor(
+                    workers=options["WORKERS"],
+                    queue_size=options["QUEUE_SIZE"],
+                    sizes=options["SIZES"],
+                    quality=options["QUALITY"],
+                )
+    return _processor
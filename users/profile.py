@@ -0,0 +1,68 @@
+import hashlib
+from django.conf import settings
+from shared.utility import TTLCache
+from .photos import photo_variants, PHOTO_DIR
+
+# Bump when the payload changes shape, so clients holding old ETags refetch.
+PROFILE_VERSION = 1
+
+
+def profile_etag(user, updated_time=None):
+    # Every write to User bumps updated_time (BaseModel.save() and the
+    # QuerySet.update() calls set it explicitly), so (id, updated_time)
+    # identifies one version of the payload.
+    updated_time = updated_time or user.updated_time
+    digest = hashlib.blake2b(
+        f"{PROFILE_VERSION}:{user.pk}:{updated_time.isoformat()}".encode(), digest_size=16
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def photo_urls(user):
+    prefix = f"{PHOTO_DIR}/"
+    return {
+        str(size): f"/users/photos/{name[len(prefix):]}"
+        for size, name in photo_variants(user.photo.name if user.photo else None).items()
+        if name.startswith(prefix)
+    }
+
+
+def profile_payload(user):
+    return {
+        "id": str(user.id),
+        "email": user.email,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "full_name": user.full_name,
+        "auth_status": user.auth_status,
+        "user_roles": user.user_roles,
+        "photo": photo_urls(user),
+    }
+
+
+class ProfileCache:
+    # Serialized "me" payloads keyed on the ETag. A changed user gets a new
+    # key, so nothing has to be invalidated; stale entries just age out.
+
+    def __init__(self, ttl=300, max_size=10000):
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def get(self, user):
+        etag = profile_etag(user)
+        payload = self.cache.get(etag)
+        if payload is None:
+            payload = profile_payload(user)
+            self.cache.set(etag, payload)
+        return etag, payload
+
+
+_profile_cache = None
+
+
+def get_profile_cache():
+    global _profile_cache
+    if _profile_cache is None:
+        options = getattr(settings, "PROFILE_CACHE", {})
+        _profile_cache = ProfileCache(ttl=options.get("TTL", 300), max_size=options.get("MAX_SIZE", 10000))
+    return _profile_cache
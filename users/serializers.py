@@ -1,17 +1,21 @@
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
+from django.db import transaction
+from django.utils import timezone
 from django.db.models import Q
 from rest_framework.fields import empty
 from .models import User, UserConfirmation
 from .models import NEW, CODE_VERIFIED, DONE, PHOTO_DONE
 from shared.utility import send_email, check_user_type
-from django.contrib.auth import authenticate
+from django.contrib.auth.signals import user_login_failed
+from django.db.models.functions import Lower
 from rest_framework.exceptions import ValidationError, PermissionDenied, NotFound
 from django.core.validators import FileExtensionValidator
-from rest_framework.generics import get_object_or_404
-from django.contrib.auth.models import update_last_login
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from .tokens import FilteredRefreshToken
+from shared.metrics import jwt_issued
+from .photos import inspect_image, get_photo_processor
 
 
 class SignUpSerializer(serializers.ModelSerializer):
@@ -34,10 +38,11 @@ class SignUpSerializer(serializers.ModelSerializer):
 
     
     def create(self, validated_data):
-        user = super(SignUpSerializer, self).create(validated_data)
-        code = user.create_verify_code()
-        send_email(user.email, code)
-        user.save()
+        with transaction.atomic():
+            user = super(SignUpSerializer, self).create(validated_data)
+            code = user.create_verify_code()
+            send_email(user.email, code)
+            user.save()
         return user
     
 
@@ -190,25 +195,30 @@ class ChangeUserInformation(serializers.Serializer):
     
 
 class ChangePhotoSerializer(serializers.Serializer):
-    photo = serializers.ImageField(
+    photo = serializers.FileField(
         validators = [
             FileExtensionValidator(
                 allowed_extensions=[
                     "jpg",
                     "jpeg",
-                    "png"
+                    "png",
+                    "webp"
                 ]
             )
         ]
     )
+
+    def validate_photo(self, photo):
+        inspect_image(photo)
+        return photo
+
     def update(self, instance, validated_data):
+        # Resizing and the PHOTO_DONE transition happen in the background.
         photo = validated_data.get('photo')
         if photo:
-            instance.photo = photo
-            instance.auth_status = PHOTO_DONE
-            instance.save()
+            get_photo_processor().submit(instance.id, photo)
         return instance
-    
+
 
 
 class LoginSerializer(TokenObtainPairSerializer):
@@ -219,40 +229,44 @@ class LoginSerializer(TokenObtainPairSerializer):
 
     def auth_validate(self, data):
         user_input = data.get('userinput')
-        if check_user_type(user_input=user_input) == "email":
-            user = self.user.get(email__iexact = user_input)
-            username = user.username
-        elif check_user_type(user_input=user_input) == "username":
-            username = user_input
-        else:
-            raise ValidationError(
-                {
-                    "success": False,
-                    "message": "Siz email yoki username kiritishingiz kerak!"
-                }
-            )
-        authentications_kwargs = {
-            self.username_field: username,
-            "password": data['password']
-        }
-        current_user = User.objects.filter(username__iexact = username).first()
-        if current_user is not None and current_user.auth_status in [NEW, CODE_VERIFIED]:
+        user_type = check_user_type(user_input=user_input)
+        user = self.find_user(user_type, user_input)
+        if user is not None and user.auth_status in [NEW, CODE_VERIFIED]:
             raise ValidationError(
                 {
                     "success": False,
                     "message": "Siz hali to'liq ro'yxatdan o'tmagansiz"
                 }
             )
-        user = authenticate(**authentications_kwargs)
-        if user is not None:
+        if user is None:
+            # Hash anyway so unknown accounts take as long as wrong passwords.
+            User().set_password(data['password'])
+        elif user.check_password(data['password']) and user.is_active:
             self.user = user
-        else:
-            raise ValidationError(
-                {
-                    'success': False,
-                    'message': "Login yoki parol xato kiritildi, Iltimos tekshirib qaytadan kiriting!"
-                }
-            )
+            return
+        user_login_failed.send(
+            sender=__name__,
+            credentials={self.username_field: user_input},
+            request=self.context.get('request')
+        )
+        raise ValidationError(
+            {
+                'success': False,
+                'message': "Login yoki parol xato kiritildi, Iltimos tekshirib qaytadan kiriting!"
+            }
+        )
+
+    @staticmethod
+    def find_user(user_type, user_input):
+        # One query on the lower(email) / lower(username) functional indexes.
+        # Names are unique case-sensitively, so prefer the exact match if the
+        # lowercase one is ambiguous.
+        users = list(
+            User.objects.alias(lookup=Lower(user_type)).filter(lookup=user_input.lower())[:2]
+        )
+        if len(users) > 1:
+            users = [user for user in users if getattr(user, user_type) == user_input]
+        return users[0] if len(users) == 1 else None
     
     def validate(self, data):
         self.auth_validate(data)
@@ -276,12 +290,16 @@ class LoginSerializer(TokenObtainPairSerializer):
 
 
 class LoginRefreshSerializer(TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
+
     def validate(self, attrs):
         data = super().validate(attrs)
+        jwt_issued.inc("access")
         access_token_instance = AccessToken(data['access'])
         user_id = access_token_instance['user_id']
-        user = get_object_or_404(User, id=user_id)
-        update_last_login(None, user)
+        # update_last_login() without loading the user again
+        if not User.objects.filter(id=user_id).update(last_login=timezone.now()):
+            raise NotFound(detail="No User matches the given query.")
         return data
     
 
@@ -301,10 +319,10 @@ class ForgotPasswordSerializer(serializers.Serializer):
                     "message": "Email kiritilishi shart!"
                 }
             )
-        user = User.objects.filter(Q(email=email_input))
-        if not user.exists():
+        user = User.objects.filter(Q(email=email_input)).first()
+        if user is None:
             raise NotFound(detail="Foydalanuvchi topilmadi! Iltimos tekshirib qaytadan urinib ko'ring!")
-        attrs['user'] = user.first()
+        attrs['user'] = user
         return attrs
     
 
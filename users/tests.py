@@ -1,3 +1,653 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from functools import partial
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.signals import user_login_failed
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models.functions import Lower
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.utils import timezone
+from PIL import Image
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from shared import throttling
+from . import authentication, profile, tokens
+from .exporter import EXPORT_FIELDS, export_rows
+from .importer import UserImporter, read_records
+from .models import User, UserImport, NEW, CODE_VERIFIED, DONE, PHOTO_DONE
+from .photos import PHOTO_DIR, PhotoProcessor, photo_name, photo_variants
+from .tokens import FilteredRefreshToken, get_blacklist_filter, prune_expired_tokens, warm_blacklist_filter
+from .verification import HMACCodeBackend
 
-# Create your tests here.
+
+class UserIndexTests(TestCase):
+
+    def test_migrations_build_on_every_backend(self):
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, User._meta.db_table)
+        self.assertIn('user_created_keyset_idx', indexes)
+        self.assertIn('user_email_lower_idx', indexes)
+        self.assertIn('user_username_lower_idx', indexes)
+        self.assertIn('user_roles_created_idx', indexes)
+        # operator class indexes only exist on PostgreSQL
+        self.assertEqual('user_email_prefix_idx' in indexes, connection.vendor == 'postgresql')
+
+    def test_login_lookup_uses_lower_index(self):
+        if connection.vendor == 'postgresql':
+            # the table is tiny, so PostgreSQL would rather scan it
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        queryset = User.objects.alias(lookup=Lower('email')).filter(lookup='a@example.com')
+        self.assertIn('user_email_lower_idx', queryset.explain())
+
+    def test_admin_prefix_search(self):
+        admin = User.objects.create_superuser(username='adminuser', email='admin@example.com', password='x')
+        User.objects.create(username='alisher', email='Alisher@example.com')
+        User.objects.create(username='bobur', email='bobur@example.com')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/users/user/', {'q': 'ALI'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user.username for user in response.context['cl'].result_list], ['alisher'])
+
+
+class UserPhotoViewTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create(username='photouser', email='photo@example.com')
+        name = f"{PHOTO_DIR}/{self.user.id}/abc-1080.webp"
+        User.objects.filter(id=self.user.id).update(photo=name)
+        for variant in photo_variants(name).values():
+            self.write(variant, b"webp-bytes")
+        self.write('secret.txt', b"secret")
+        self.write(f"{PHOTO_DIR}/orphan.webp", b"orphan")
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {self.user.token()['access']}"}
+
+    def write(self, name, content):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+
+    def test_serves_photo_variants(self):
+        response = self.client.get(f"/users/photos/{self.user.id}/abc-320.webp", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"webp-bytes")
+
+    def test_serves_byte_ranges(self):
+        response = self.client.get(f"/users/photos/{self.user.id}/abc-1080.webp", HTTP_RANGE='bytes=0-3', **self.auth)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], "bytes 0-3/10")
+        self.assertEqual(b"".join(response.streaming_content), b"webp")
+
+    def test_rejects_paths_outside_photo_dir(self):
+        for path in ('../secret.txt', '..%2Fsecret.txt', 'x/..%2F..%2Fsecret.txt', f'{self.user.id}/..%2F..%2Fsecret.txt'):
+            with self.subTest(path=path):
+                response = self.client.get(f"/users/photos/{path}", **self.auth)
+                self.assertEqual(response.status_code, 404)
+
+    def test_rejects_files_that_are_no_users_photo(self):
+        response = self.client.get("/users/photos/orphan.webp", **self.auth)
+        self.assertEqual(response.status_code, 404)
+
+    def test_requires_authentication(self):
+        response = self.client.get(f"/users/photos/{self.user.id}/abc-320.webp")
+        self.assertEqual(response.status_code, 401)
+
+
+class PhotoProcessorTests(TestCase):
+    # process() is what the worker threads run; it is called directly here.
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media, USER_PHOTOS={**settings.USER_PHOTOS, "SIZES": (64, 16)})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.processor = PhotoProcessor(workers=1, sizes=(64, 16))
+        self.addCleanup(self.processor.shutdown)
+        self.upload = os.path.join(self.media, 'upload.jpg')
+        Image.new('RGB', (200, 100), 'red').save(self.upload, 'JPEG')
+
+    def create_user(self, auth_status, previous=None):
+        user = User.objects.create(username=f'photo_{auth_status}', email=f'{auth_status}@example.com',
+                                   auth_status=auth_status)
+        if previous:
+            name = photo_name(user.id, previous, 64)
+            for variant in photo_variants(name).values():
+                default_storage.save(variant, ContentFile(b"old"))
+            User.objects.filter(id=user.id).update(photo=name)
+        return user
+
+    def test_renders_variants_and_finishes_registration(self):
+        user = self.create_user(DONE, previous='old')
+        old = photo_variants(User.objects.get(id=user.id).photo.name)
+        self.processor.process(user.id, self.upload)
+
+        user = User.objects.get(id=user.id)
+        self.assertEqual(user.auth_status, PHOTO_DONE)
+        variants = photo_variants(user.photo.name)
+        self.assertEqual(user.photo.name, variants[64])
+        for size, name in variants.items():
+            with default_storage.open(name) as file, Image.open(file) as image:
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.size, (size, size // 2))
+        for name in old.values():
+            self.assertFalse(default_storage.exists(name))
+
+    def test_status_only_moves_from_done(self):
+        user = self.create_user(NEW)
+        self.processor.process(user.id, self.upload)
+        user = User.objects.get(id=user.id)
+        self.assertEqual(user.auth_status, NEW)
+        self.assertTrue(default_storage.exists(user.photo.name))
+
+
+class UserSaveTests(TestCase):
+
+    def test_assigned_deferred_field_is_saved(self):
+        user = User.objects.create(username='deferred', email='deferred@example.com')
+        loaded = User.objects.only('id', 'username').get(id=user.id)
+        loaded.first_name = 'CHANGED'
+        loaded.save()
+        self.assertEqual(User.objects.get(id=user.id).first_name, 'CHANGED')
+
+    def test_partial_refresh_keeps_local_edits(self):
+        user = User.objects.create(username='refreshed', email='refreshed@example.com')
+        user = User.objects.get(id=user.id)
+        user.first_name = 'LOCAL'
+        user.refresh_from_db(fields=['auth_status'])
+        user.save()
+        self.assertEqual(User.objects.get(id=user.id).first_name, 'LOCAL')
+
+    def test_save_after_delete_inserts_again(self):
+        user = User.objects.create(username='deleted', email='deleted@example.com')
+        user = User.objects.get(id=user.id)
+        User.objects.filter(id=user.id).delete()
+        user.first_name = 'QAYTA'
+        user.save()
+        self.assertEqual(User.objects.get(id=user.id).first_name, 'QAYTA')
+
+
+class HMACCodeBackendTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.backend = HMACCodeBackend()
+        self.user = User.objects.create(username='hmacuser', email='hmac@example.com')
+
+    def test_code_is_accepted_once(self):
+        code = self.backend.issue(self.user)
+        self.assertTrue(self.backend.has_active_code(self.user))
+        self.assertTrue(self.backend.verify(self.user, code))
+        self.assertFalse(self.backend.has_active_code(self.user))
+        # replay
+        self.assertFalse(self.backend.verify(self.user, code))
+
+    def test_code_expires_after_the_next_window(self):
+        now = time.time()
+        with mock.patch('users.verification.time.time', return_value=now):
+            code = self.backend.issue(self.user)
+        with mock.patch('users.verification.time.time', return_value=now + 2 * self.backend.window):
+            self.assertFalse(self.backend.verify(self.user, code))
+        with mock.patch('users.verification.time.time', return_value=now + self.backend.window):
+            self.assertTrue(self.backend.verify(self.user, code))
+
+    def test_status_change_retires_code(self):
+        code = self.backend.issue(self.user)
+        self.user.auth_status = CODE_VERIFIED
+        self.assertFalse(self.backend.verify(self.user, code))
+
+    def test_issue_writes_nothing_to_the_database(self):
+        with self.assertNumQueries(0):
+            self.backend.issue_many([self.user])
+
+
+class UserCacheTests(TestCase):
+
+    def setUp(self):
+        authentication._user_cache = None
+        self.user = User.objects.create(username='cacheduser', email='cached@example.com', auth_status=DONE)
+        self.headers = {'HTTP_AUTHORIZATION': f"Bearer {self.user.token()['access']}"}
+
+    def test_user_is_resolved_from_cache(self):
+        self.assertEqual(self.client.get('/users/me/', **self.headers).status_code, 200)
+        self.assertIsNotNone(authentication.get_user_cache().get(self.user.id))
+
+    def test_save_invalidates_cached_user(self):
+        self.client.get('/users/me/', **self.headers)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(authentication.get_user_cache().get(self.user.id))
+        self.assertEqual(self.client.get('/users/me/', **self.headers).status_code, 401)
+
+    def test_shared_cache_is_the_default(self):
+        self.assertEqual(authentication.get_user_cache().backend, 'django')
+
+    def test_state_changes_read_auth_status_fresh(self):
+        # Another process verified the user; this one still has it cached as NEW.
+        stale = User.objects.get(id=self.user.id)
+        stale.auth_status = NEW
+        authentication.get_user_cache().set(self.user.id, stale)
+        User.objects.filter(id=self.user.id).update(auth_status=CODE_VERIFIED)
+        data = {
+            "first_name": "Cached", "last_name": "Userov", "username": "cached_user",
+            "password": PASSWORD, "confirm_password": PASSWORD,
+        }
+        response = self.client.put('/users/change-user/', json.dumps(data), content_type='application/json', **self.headers)
+        self.assertEqual(response.json()['auth_status'], DONE)
+        self.assertEqual(User.objects.get(id=self.user.id).auth_status, DONE)
+
+    def test_cached_instance_is_not_shared(self):
+        cache = authentication.get_user_cache()
+        cache.set(self.user.id, self.user)
+        cache.get(self.user.id).first_name = 'CHANGED'
+        self.assertNotEqual(cache.get(self.user.id).first_name, 'CHANGED')
+
+
+class MeViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='meuser', email='me@example.com', auth_status=DONE)
+        self.headers = {'HTTP_AUTHORIZATION': f"Bearer {self.user.token()['access']}"}
+
+    def test_change_in_another_process_is_seen(self):
+        response = self.client.get('/users/me/', **self.headers)
+        etag = response['ETag']
+        # a write this process' cached user doesn't know about
+        User.objects.filter(id=self.user.id).update(first_name='Boshqa', updated_time=timezone.now())
+        response = self.client.get('/users/me/', HTTP_IF_NONE_MATCH=etag, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['first_name'], 'Boshqa')
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.get('/users/me/', HTTP_IF_NONE_MATCH=response['ETag'], **self.headers)
+        self.assertEqual(response.status_code, 304)
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        password = make_password('x')
+        cls.admin = User.objects.create(username='exportadmin', email='exportadmin@example.com', password=password,
+                                        is_staff=True, is_superuser=True, auth_status=DONE)
+        cls.users = [
+            User.objects.create(username=f'export{number:02d}', email=f'export{number:02d}@example.com',
+                                password=password, auth_status=DONE if number % 2 else NEW)
+            for number in range(11)
+        ]
+        # three users per created_time, so pages end in the middle of ties
+        base = timezone.now() - timedelta(days=1)
+        for number, user in enumerate(cls.users):
+            User.objects.filter(id=user.id).update(created_time=base + timedelta(minutes=number // 3))
+        User.objects.filter(id=cls.admin.id).update(created_time=base + timedelta(days=2))
+        cls.expected = list(
+            User.objects.order_by('created_time', 'id').values_list('id', flat=True)
+        )
+
+    def export(self, **params):
+        token = self.admin.token()['access']
+        response = self.client.get('/users/export/', params, HTTP_AUTHORIZATION=f'Bearer {token}')
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_pages_skip_and_repeat_nothing(self):
+        for page_size in (1, 2, 3, 4, 5, 100):
+            with self.subTest(page_size=page_size):
+                ids = [row[0] for row in export_rows(page_size=page_size, chunk_size=2)]
+                self.assertEqual(ids, self.expected)
+
+    def test_csv_export(self):
+        with mock.patch('users.views.export_rows', partial(export_rows, page_size=4)):
+            response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(tuple(rows[0]), EXPORT_FIELDS)
+        self.assertEqual([row[0] for row in rows[1:]], [str(pk) for pk in self.expected])
+
+    def test_ndjson_export_with_filters(self):
+        created = User.objects.get(id=self.users[3].id).created_time
+        params = {
+            'file_format': 'ndjson', 'auth_status': DONE,
+            'created_from': created.isoformat(), 'created_to': (created + timedelta(minutes=2)).isoformat(),
+        }
+        with mock.patch('users.views.export_rows', partial(export_rows, page_size=1)):
+            response, content = self.export(**params)
+        records = [json.loads(line) for line in content.splitlines()]
+        # users 3-8 fall in the two minutes, the odd ones are DONE
+        wanted = {self.users[number].id for number in (3, 5, 7)}
+        self.assertEqual([record['id'] for record in records], [str(pk) for pk in self.expected if pk in wanted])
+
+    def test_invalid_parameters(self):
+        for params in ({'file_format': 'xml'}, {'auth_status': 'nope'}, {'created_from': 'kecha'}):
+            with self.subTest(params=params):
+                token = self.admin.token()['access']
+                response = self.client.get('/users/export/', params, HTTP_AUTHORIZATION=f'Bearer {token}')
+                self.assertEqual(response.status_code, 400)
+
+    def test_admin_export_actions(self):
+        self.client.force_login(self.admin)
+        selected = [str(user.id) for user in self.users[:4]]
+        for action, parse in (('export_csv', lambda content: [row[0] for row in csv.reader(io.StringIO(content))][1:]),
+                              ('export_ndjson', lambda content: [json.loads(line)['id'] for line in content.splitlines()])):
+            with self.subTest(action=action):
+                response = self.client.post('/admin/users/user/', {'action': action, '_selected_action': selected})
+                content = b''.join(response.streaming_content).decode()
+                self.assertEqual(parse(content), [str(pk) for pk in self.expected if str(pk) in selected])
+
+
+CSV_ROWS = (
+    "email,username,first_name,password\n"
+    "ali@example.com,ali_1,Ali,Parol-12345\n"
+    "vali@example.com,,Vali,\n"
+    "not-an-email,,X,\n"
+    "ALI@example.com,ali_2,Ali,\n"
+)
+
+
+class UserImporterTests(TestCase):
+
+    def test_imports_valid_rows_once(self):
+        User.objects.create(username='existing', email='vali@example.com')
+        result = UserImporter().run(read_records(io.BytesIO(CSV_ROWS.encode()), 'csv'))
+        self.assertEqual((result['created'], result['skipped'], result['invalid']), (1, 2, 1))
+        user = User.objects.get(email='ali@example.com')
+        self.assertEqual(user.username, 'ali_1')
+        self.assertTrue(user.check_password('Parol-12345'))
+
+    def test_ndjson(self):
+        records = b'{"email": "a@example.com"}\n\nnot json\n{"email": "b@example.com", "user_roles": "manager"}\n'
+        result = UserImporter().run(read_records(io.BytesIO(records), 'ndjson'))
+        self.assertEqual((result['created'], result['invalid']), (2, 1))
+        self.assertEqual(result['errors'], [{"line": 3, "message": "Qatorni o'qib bo'lmadi"}])
+        self.assertEqual(User.objects.get(email='b@example.com').user_roles, 'manager')
+
+
+class ImportUsersViewTests(TransactionTestCase):
+
+    def test_imports_in_the_background(self):
+        admin = User.objects.create_superuser(username='importer', email='importer@example.com', password='x')
+        auth = {'HTTP_AUTHORIZATION': f"Bearer {admin.token()['access']}"}
+        upload = SimpleUploadedFile('users.csv', CSV_ROWS.encode(), content_type='text/csv')
+        response = self.client.post('/users/import/', {'file': upload}, **auth)
+        self.assertEqual(response.status_code, 202)
+        job_url = f"/users/import/{response.json()['id']}/"
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            job = self.client.get(job_url, **auth).json()
+            if job['status'] in (UserImport.DONE, UserImport.FAILED):
+                break
+            time.sleep(0.05)
+        self.assertEqual(job['status'], UserImport.DONE)
+        self.assertEqual(job['result']['created'], 2)
+        self.assertTrue(User.objects.filter(email='vali@example.com').exists())
+
+
+class BlacklistFilterTests(TransactionTestCase):
+
+    def setUp(self):
+        tokens._blacklist_filter = None
+        self.addCleanup(setattr, tokens, '_blacklist_filter', None)
+        self.user = User.objects.create(username='tokenuser', email='token@example.com')
+
+    def refresh_token(self):
+        return FilteredRefreshToken(self.user.token()['refresh_token'])
+
+    def test_warmed_at_startup(self):
+        revoked = self.refresh_token()
+        revoked.blacklist()
+        tokens._blacklist_filter = None
+        warm_blacklist_filter()
+        jti_filter = get_blacklist_filter()
+        self.assertIsNotNone(jti_filter.bloom)
+        # a hit is confirmed in the database, a miss is not
+        with self.assertNumQueries(1):
+            self.assertTrue(jti_filter.is_blacklisted(revoked['jti']))
+        with self.assertNumQueries(0):
+            self.assertFalse(jti_filter.is_blacklisted('unknown-jti'))
+
+    def test_blacklisted_token_cannot_refresh(self):
+        revoked = self.refresh_token()
+        revoked.blacklist()
+        with self.assertRaises(TokenError):
+            FilteredRefreshToken(str(revoked))
+        FilteredRefreshToken(str(self.refresh_token()))
+
+    def test_picks_up_tokens_blacklisted_elsewhere(self):
+        jti_filter = get_blacklist_filter()
+        jti_filter.warm()
+        revoked = self.refresh_token()
+        # as another process would, without going through this filter
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=revoked['jti']))
+        jti_filter._synced_at -= jti_filter.sync_interval
+        self.assertTrue(jti_filter.is_blacklisted(revoked['jti']))
+
+
+class PruneExpiredTokensTests(TestCase):
+
+    def test_deletes_expired_tokens_in_batches(self):
+        user = User.objects.create(username='pruneuser', email='prune@example.com')
+        now = timezone.now()
+        expired = [
+            OutstandingToken.objects.create(user=user, jti=f"old-{number}", token="x", expires_at=now - timedelta(days=1))
+            for number in range(5)
+        ]
+        BlacklistedToken.objects.create(token=expired[0])
+        current = OutstandingToken.objects.create(user=user, jti="current", token="x", expires_at=now + timedelta(days=1))
+        BlacklistedToken.objects.create(token=current)
+
+        result = prune_expired_tokens(batch_size=2, pause=0)
+        self.assertEqual((result['outstanding_removed'], result['blacklisted_removed']), (5, 1))
+        self.assertEqual(result['batches'], 3)
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ["current"])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+PASSWORD = "Budget-parol-2024"
+
+
+@override_settings(THROTTLING={"ENABLED": False})
+class ViewQueryBudgetTests(TestCase):
+    # Run under shared.test_runner.QueryBudgetTestRunner, a request over its
+    # view's query_budget raises QueryBudgetExceeded. Caches are emptied before
+    # every request, since the budgets are for cold caches.
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='budgetuser', email='budget@example.com', auth_status=DONE, password=PASSWORD
+        )
+
+    def request(self, method, path, data=None, user=None, **extra):
+        authentication._user_cache = None
+        tokens._blacklist_filter = None
+        profile._profile_cache = None
+        if user is not None:
+            extra['HTTP_AUTHORIZATION'] = f"Bearer {user.token()['access']}"
+        return getattr(self.client, method)(path, data, **extra)
+
+    def test_signup(self):
+        response = self.request('post', '/users/signup/', {"email": "new@example.com"})
+        self.assertEqual(response.status_code, 201)
+
+    def test_verify(self):
+        user = User.objects.create(username='verifyuser', email='verify@example.com')
+        code = user.create_verify_code()
+        response = self.request('post', '/users/verify/', {"code": code}, user=user)
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_verify(self):
+        user = User.objects.create(username='newverify', email='newverify@example.com')
+        self.assertEqual(self.request('get', '/users/new-verify/', user=user).status_code, 200)
+        # the code just sent is still active
+        self.assertEqual(self.request('get', '/users/new-verify/', user=user).status_code, 400)
+
+    def test_me(self):
+        response = self.request('get', '/users/me/', user=self.user)
+        self.assertEqual(response.status_code, 200)
+        response = self.request('get', '/users/me/', user=self.user, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_change_user(self):
+        user = User.objects.create(username='changeuser', email='change@example.com', auth_status=CODE_VERIFIED)
+        data = {
+            "first_name": "Budget", "last_name": "Testov", "username": "changed_user",
+            "password": PASSWORD, "confirm_password": PASSWORD,
+        }
+        response = self.request('put', '/users/change-user/', json.dumps(data), user=user, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_change_photo(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30)).save(buffer, 'JPEG')
+        photo = SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with mock.patch('users.serializers.get_photo_processor') as processor:
+            response = self.request('put', '/users/change-photo/', encode_multipart(BOUNDARY, {"photo": photo}),
+                                    user=self.user, content_type=MULTIPART_CONTENT)
+        self.assertEqual(response.status_code, 202)
+        processor.return_value.submit.assert_called_once()
+
+    def test_login(self):
+        response = self.request('post', '/users/login/', {"userinput": "BudgetUser", "password": PASSWORD})
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_upgrades_legacy_hash(self):
+        User.objects.filter(id=self.user.id).update(password=make_password(PASSWORD, hasher='pbkdf2_sha256'))
+        response = self.request('post', '/users/login/', {"userinput": "budget@example.com", "password": PASSWORD})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(User.objects.get(id=self.user.id).password.startswith('pbkdf2_sha256$'))
+
+    def test_login_refresh_and_logout(self):
+        refresh = self.user.token()['refresh_token']
+        response = self.request('post', '/users/login/refresh/', {"refresh": refresh})
+        self.assertEqual(response.status_code, 200)
+        response = self.request('post', '/users/logout/', {"refresh": refresh}, user=self.user)
+        self.assertEqual(response.status_code, 205)
+        response = self.request('post', '/users/login/refresh/', {"refresh": refresh})
+        self.assertEqual(response.status_code, 401)
+
+    def test_forgot_and_reset_password(self):
+        response = self.request('post', '/users/forgot-password/', {"email": "budget@example.com"})
+        self.assertEqual(response.status_code, 200)
+        data = {"password": "Yangi-parol-2025", "confirm_password": "Yangi-parol-2025"}
+        response = self.request('put', '/users/reset-password/', json.dumps(data), user=self.user,
+                                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(THROTTLING={**settings.THROTTLING, "ENABLED": False})
+class AsyncViewTests(TestCase):
+    # The /users/async/ endpoints answer exactly like their sync versions.
+
+    def call(self, client, method, path, data=None, token=None, **extra):
+        headers = {'Authorization': f"Bearer {token}"} if token else {}
+        if client == 'async':
+            return async_to_sync(getattr(self.async_client, method))(path, data, headers=headers, **extra)
+        return getattr(self.client, method)(path, data, headers=headers, **extra)
+
+    @staticmethod
+    def shape(response):
+        # status, body without the values that differ per user, auth headers
+        body = response.json()
+        if isinstance(body, dict):
+            body = {key: '<value>' if key in ('id', 'email', 'access', 'refresh_token', 'refresh') else value
+                    for key, value in body.items()}
+        headers = {name: response[name] for name in ('WWW-Authenticate', 'Retry-After') if response.has_header(name)}
+        return response.status_code, body, headers
+
+    def flow(self, client, email):
+        prefix = '/users/async/' if client == 'async' else '/users/'
+        responses = [self.call(client, 'post', f'{prefix}signup/', {"email": email})]
+        access = responses[-1].json()['access']
+        code = User.objects.get(email=email).verify_codes.latest('created_time').code
+        responses.append(self.call(client, 'post', f'{prefix}verify/', {"code": "xato"}, access))
+        responses.append(self.call(client, 'post', f'{prefix}verify/', {"code": code}, access))
+        # registration is finished through the sync endpoint
+        data = {
+            "first_name": "Asinxron", "last_name": "Testov", "username": email.split('@')[0],
+            "password": PASSWORD, "confirm_password": PASSWORD,
+        }
+        self.call('sync', 'put', '/users/change-user/', json.dumps(data), access, content_type='application/json')
+        responses.append(self.call(client, 'post', f'{prefix}login/', {"userinput": email, "password": 'xato-parol'}))
+        responses.append(self.call(client, 'post', f'{prefix}login/', {"userinput": email, "password": PASSWORD}))
+        refresh = responses[-1].json()['refresh_token']
+        responses.append(self.call(client, 'post', f'{prefix}login/refresh/', {"refresh": refresh}))
+        responses.append(self.call(client, 'post', f'{prefix}login/refresh/', {"refresh": access}))
+        return [self.shape(response) for response in responses]
+
+    def test_signup_verify_login_refresh(self):
+        sync = self.flow('sync', 'sync_flow@example.com')
+        self.assertEqual([status for status, body, headers in sync], [201, 400, 200, 400, 200, 200, 401])
+        self.assertEqual(self.flow('async', 'async_flow@example.com'), sync)
+
+    def test_error_responses(self):
+        user = User.objects.create(username='asyncerrors', email='errors@example.com')
+        user.create_verify_code()
+        access = user.token()['access']
+        requests = [
+            ('post', 'signup/', {}, None, {}),
+            ('post', 'signup/', '[1]', None, {'content_type': 'application/json'}),
+            ('post', 'signup/', '{', None, {'content_type': 'application/json'}),
+            ('post', 'signup/', {"email": "ERRORS@example.com"}, None, {}),
+            ('post', 'verify/', {"code": "1"}, None, {}),
+            ('post', 'verify/', {"code": "1"}, 'not-a-token', {}),
+            ('get', 'new-verify/', None, access, {}),
+            ('post', 'login/', {}, None, {}),
+            ('post', 'login/', {"userinput": "!!", "password": "x"}, None, {}),
+            ('post', 'login/', {"userinput": "errors@example.com", "password": "x"}, None, {}),
+            ('post', 'login/refresh/', {}, None, {}),
+            ('post', 'login/refresh/', {"refresh": "not-a-token"}, None, {}),
+        ]
+        for method, path, data, token, extra in requests:
+            with self.subTest(path=path, data=data):
+                sync = self.shape(self.call('sync', method, f'/users/{path}', data, token, **extra))
+                self.assertEqual(self.shape(self.call('async', method, f'/users/async/{path}', data, token, **extra)), sync)
+
+    @override_settings(THROTTLING={**settings.THROTTLING, "RATES": {"login": {"ip": "1/min"}}})
+    def test_throttled_response(self):
+        responses = {}
+        for client, path in (('sync', '/users/login/'), ('async', '/users/async/login/')):
+            throttling._storage = None
+            with self.assertLogs('shared.throttling', 'WARNING'):
+                for _ in range(2):
+                    response = self.call(client, 'post', path, {"userinput": "nobody", "password": "x"})
+            responses[client] = response
+        self.addCleanup(setattr, throttling, '_storage', None)
+        self.assertEqual(responses['async'].status_code, 429)
+        self.assertEqual(responses['async'].json().keys(), responses['sync'].json().keys())
+        self.assertTrue(responses['async'].has_header('Retry-After'))
+
+    def test_failed_login_sends_user_login_failed(self):
+        User.objects.create(username='asyncfailed', email='failed@example.com', auth_status=DONE, password=PASSWORD)
+        failures = []
+        receiver = lambda sender, credentials, **kwargs: failures.append(credentials)
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        for client, path in (('sync', '/users/login/'), ('async', '/users/async/login/')):
+            self.call(client, 'post', path, {"userinput": "failed@example.com", "password": "xato-parol"})
+        self.assertEqual(failures, [{'username': 'failed@example.com'}] * 2)
+
+    def test_login_upgrades_legacy_hash(self):
+        User.objects.create(
+            username='asynclegacy', email='legacy@example.com', auth_status=DONE,
+            password=make_password(PASSWORD, hasher='pbkdf2_sha256'),
+        )
+        response = self.call('async', 'post', '/users/async/login/', {"userinput": "legacy@example.com", "password": PASSWORD})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(User.objects.get(username='asynclegacy').password.startswith('pbkdf2_sha256$'))
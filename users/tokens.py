@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import BlacklistMixin, RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from shared.metrics import jwt_issued
+from shared.utility import BloomFilter
+
+
+logger = logging.getLogger(__name__)
+
+BLACKLIST_INSTALLED = 'rest_framework_simplejwt.token_blacklist' in settings.INSTALLED_APPS
+
+
+def token_pair(refresh):
+    return {
+        "access": str(refresh.access_token),
+        "refresh_token": str(refresh)
+    }
+
+
+def issue_tokens(user):
+    # One RefreshToken (and one OutstandingToken row) per call; callers that
+    # need both tokens must reuse the returned pair.
+    jwt_issued.inc("pair")
+    return token_pair(RefreshToken.for_user(user))
+
+
+async def aissue_tokens(user):
+    jwt_issued.inc("pair")
+    refresh = super(BlacklistMixin, RefreshToken).for_user(user)
+    pair = token_pair(refresh)
+    if BLACKLIST_INSTALLED:
+        await OutstandingToken.objects.acreate(**_outstanding_token_fields(user, refresh, pair))
+    return pair
+
+
+def _outstanding_token_fields(user, refresh, pair):
+    return {
+        "user": user,
+        "jti": refresh[api_settings.JTI_CLAIM],
+        "token": pair["refresh_token"],
+        "created_at": refresh.current_time,
+        "expires_at": datetime_from_epoch(refresh["exp"]),
+    }
+
+
+def issue_tokens_bulk(users, batch_size=1000):
+    # Mints a pair per user and records all outstanding tokens with
+    # bulk_create instead of one INSERT per token. Returns the pairs in order.
+    pairs = []
+    outstanding = []
+    for user in users:
+        # Skip BlacklistMixin.for_user, which inserts the OutstandingToken row itself.
+        refresh = super(BlacklistMixin, RefreshToken).for_user(user)
+        pair = token_pair(refresh)
+        pairs.append(pair)
+        if BLACKLIST_INSTALLED:
+            outstanding.append(OutstandingToken(**_outstanding_token_fields(user, refresh, pair)))
+    if outstanding:
+        OutstandingToken.objects.bulk_create(outstanding, batch_size=batch_size)
+    jwt_issued.inc("pair", amount=len(pairs))
+    return pairs
+
+
+class BlacklistedJTIFilter:
+    # Bloom filter of blacklisted JTIs. A miss means the token is not
+    # blacklisted and the database is skipped; a hit is confirmed against
+    # BlacklistedToken. Tokens blacklisted by other processes are picked up
+    # by an incremental sync every SYNC_INTERVAL seconds, so they can still
+    # refresh for up to that long. The filter is rebuilt every
+    # REBUILD_INTERVAL seconds (or when it outgrows its capacity) to drop
+    # pruned tokens.
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001, sync_interval=5.0, rebuild_interval=3600.0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.bloom = None
+        self._last_id = 0
+        self._synced_at = 0.0
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.false_positives = 0
+
+    def warm(self):
+        with self._lock:
+            self._build()
+
+    def _build(self):
+        total = BlacklistedToken.objects.count()
+        capacity = max(self.capacity, total * 2)
+        bloom = BloomFilter(capacity, self.error_rate)
+        last_id = 0
+        for pk, jti in BlacklistedToken.objects.order_by('id').values_list('id', 'token__jti').iterator(chunk_size=10000):
+            bloom.add(jti)
+            last_id = pk
+        self.bloom, self._last_id = bloom, last_id
+        self._synced_at = self._built_at = time.monotonic()
+
+    def _sync(self):
+        now = time.monotonic()
+        if self.bloom is not None and now - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if self.bloom is None or now - self._built_at >= self.rebuild_interval or self.bloom.count >= self.bloom.capacity:
+                self._build()
+                return
+            if now - self._synced_at < self.sync_interval:
+                return
+            rows = BlacklistedToken.objects.filter(id__gt=self._last_id).order_by('id').values_list('id', 'token__jti')
+            for pk, jti in rows:
+                self.bloom.add(jti)
+                self._last_id = pk
+            self._synced_at = now
+
+    def add(self, jti):
+        self._sync()
+        self.bloom.add(jti)
+
+    def is_blacklisted(self, jti):
+        self._sync()
+        if jti not in self.bloom:
+            self.misses += 1
+            return False
+        if BlacklistedToken.objects.filter(token__jti=jti).exists():
+            self.hits += 1
+            return True
+        self.false_positives += 1
+        return False
+
+
+_blacklist_filter = None
+_blacklist_filter_lock = threading.Lock()
+
+
+def get_blacklist_filter():
+    global _blacklist_filter
+    if _blacklist_filter is None:
+        with _blacklist_filter_lock:
+            if _blacklist_filter is None:
+                options = getattr(settings, "JTI_BLACKLIST_FILTER", {})
+                _blacklist_filter = BlacklistedJTIFilter(
+                    capacity=options.get("CAPACITY", 1_000_000),
+                    error_rate=options.get("ERROR_RATE", 0.001),
+                    sync_interval=options.get("SYNC_INTERVAL", 5.0),
+                    rebuild_interval=options.get("REBUILD_INTERVAL", 3600.0),
+                )
+    return _blacklist_filter
+
+
+def warm_blacklist_filter():
+    # Called from the WSGI/ASGI entry points so the first refresh in each
+    # worker doesn't build the filter inside a request. If the database is
+    # not reachable yet, the first refresh builds it instead.
+    if not BLACKLIST_INSTALLED or not getattr(settings, "JTI_BLACKLIST_FILTER", {}).get("WARM_ON_STARTUP", True):
+        return
+    try:
+        get_blacklist_filter().warm()
+    except DatabaseError:
+        logger.warning("Warming the refresh token blacklist filter failed", exc_info=True)
+    finally:
+        # The server's request threads open their own connections.
+        connections.close_all()
+
+
+class FilteredRefreshToken(RefreshToken):
+    # RefreshToken whose blacklist check goes through the in-process filter.
+
+    def check_blacklist(self):
+        if get_blacklist_filter().is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        # The base class loads the user only to fill in a missing
+        # OutstandingToken; look for the token first.
+        jti = self.payload[api_settings.JTI_CLAIM]
+        token = OutstandingToken.objects.filter(jti=jti).first()
+        if token is None:
+            result = super().blacklist()
+        else:
+            result = BlacklistedToken.objects.get_or_create(token=token)
+        get_blacklist_filter().add(jti)
+        return result
+
+
+def prune_expired_tokens(batch_size=5000, pause=0.1, time_budget=None):
+    # Deletes expired OutstandingToken rows (and their BlacklistedToken rows)
+    # oldest first, one short transaction per batch. Each batch is a range scan
+    # on outstanding_token_expires_idx. Stops when nothing is left or the time
+    # budget (seconds) is spent.
+    started = time.monotonic()
+    now = timezone.now()
+    removed = blacklisted = batches = 0
+    while time_budget is None or time.monotonic() - started < time_budget:
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lt=now)
+            .order_by('expires_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        # One transaction; the BlacklistedToken rows go with them through the
+        # cascade. only('id') keeps the token text out of the collector's SELECT.
+        _, deleted = OutstandingToken.objects.filter(id__in=ids).only('id').delete()
+        removed += deleted.get(OutstandingToken._meta.label, 0)
+        blacklisted += deleted.get(BlacklistedToken._meta.label, 0)
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    elapsed = time.monotonic() - started
+    return {
+        "outstanding_removed": removed,
+        "blacklisted_removed": blacklisted,
+        "batches": batches,
+        "elapsed": elapsed,
+        "rows_per_second": (removed + blacklisted) / elapsed if elapsed else 0.0,
+    }
@@ -1,5 +1,7 @@
 from django.urls import path
 from .views import *
+from .async_views import AsyncCreateUserView, AsyncVerifyView, AsyncNewVerificationView, AsyncLoginView, \
+    AsyncLoginRefreshView
 
 urlpatterns = [
     path('login/', LoginView.as_view()),
@@ -8,8 +10,19 @@ urlpatterns = [
     path('signup/', CreateUserApiView.as_view()),
     path('verify/', VerifyApiView.as_view()),
     path('new-verify/', GetNewVerification.as_view()),
+    path('me/', MeView.as_view()),
     path('change-user/', ChangeUserInformationView.as_view()),
     path('change-photo/', ChangePhotoView.as_view()),
+    path('photos/<path:name>', UserPhotoView.as_view()),
     path('forgot-password/', ForgotPasswordView.as_view()),
     path('reset-password/', ResetPasswordView.as_view()),
+    path('import/', ImportUsersView.as_view()),
+    path('import/<uuid:pk>/', UserImportView.as_view()),
+    path('export/', ExportUsersView.as_view()),
+    # native async versions, meant to be served through config.asgi
+    path('async/signup/', AsyncCreateUserView.as_view()),
+    path('async/verify/', AsyncVerifyView.as_view()),
+    path('async/new-verify/', AsyncNewVerificationView.as_view()),
+    path('async/login/', AsyncLoginView.as_view()),
+    path('async/login/refresh/', AsyncLoginRefreshView.as_view()),
 ]
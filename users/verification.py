@@ -0,0 +1,135 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.module_loading import import_string
+
+
+class DatabaseCodeBackend:
+    # One UserConfirmation row per issued code.
+
+    def issue(self, user):
+        code = self._random_code()
+        user.verify_codes.create(code=code)
+        return code
+
+    def issue_many(self, users):
+        # bulk_create() skips UserConfirmation.save(), so the expiry is set here.
+        if not users:
+            return []
+        codes = [self._random_code() for _ in users]
+        expiration_time = datetime.now() + timedelta(minutes=5)
+        users[0].verify_codes.model.objects.bulk_create(
+            [
+                users[0].verify_codes.model(user=user, code=code, expiration_time=expiration_time)
+                for user, code in zip(users, codes)
+            ]
+        )
+        return codes
+
+    def verify(self, user, code):
+        confirmed = user.verify_codes.filter(
+            expiration_time__gte=datetime.now(), code=code, is_confirmed=False
+        ).update(is_confirmed=True)
+        return confirmed > 0
+
+    def has_active_code(self, user):
+        return user.verify_codes.filter(expiration_time__gte=datetime.now(), is_confirmed=False).exists()
+
+    async def averify(self, user, code):
+        confirmed = await user.verify_codes.filter(
+            expiration_time__gte=datetime.now(), code=code, is_confirmed=False
+        ).aupdate(is_confirmed=True)
+        return confirmed > 0
+
+    async def ahas_active_code(self, user):
+        return await user.verify_codes.filter(expiration_time__gte=datetime.now(), is_confirmed=False).aexists()
+
+    @staticmethod
+    def _random_code():
+        return "".join([str(random.randint(0, 10000) % 10) for _ in range(4)])
+
+
+class HMACCodeBackend:
+    # Codes are derived from SECRET_KEY, the user and the current time window,
+    # so issuing one writes nothing to the database. The user's password hash
+    # and auth_status are mixed in, which retires old codes once they change.
+    # A code is accepted in its own window and the next one; the cache holds
+    # the replay guard and the "code already sent" marker (use a shared cache
+    # when running several processes).
+    key_salt = "users.verification.HMACCodeBackend"
+
+    def __init__(self):
+        options = getattr(settings, "VERIFICATION_CODE", {})
+        self.window = options.get("WINDOW", 300)
+        self.cache = caches[options.get("CACHE", "default")]
+
+    def issue(self, user):
+        counter = self._counter()
+        self.cache.set(self._issued_key(user), counter, self.window)
+        return self._code(user, counter)
+
+    def issue_many(self, users):
+        counter = self._counter()
+        self.cache.set_many({self._issued_key(user): counter for user in users}, self.window)
+        return [self._code(user, counter) for user in users]
+
+    def verify(self, user, code):
+        current = self._counter()
+        for counter in (current, current - 1):
+            if constant_time_compare(str(code), self._code(user, counter)):
+                # cache.add() is atomic: only the first use of a code succeeds.
+                if not self.cache.add(self._used_key(user, counter), True, 2 * self.window):
+                    return False
+                self.cache.delete(self._issued_key(user))
+                return True
+        return False
+
+    def has_active_code(self, user):
+        return self.cache.get(self._issued_key(user)) is not None
+
+    async def averify(self, user, code):
+        return await sync_to_async(self.verify)(user, code)
+
+    async def ahas_active_code(self, user):
+        return await sync_to_async(self.has_active_code)(user)
+
+    def _counter(self):
+        return int(time.time()) // self.window
+
+    def _code(self, user, counter):
+        digest = salted_hmac(
+            self.key_salt,
+            f"{user.pk}:{user.password}:{user.auth_status}:{counter}",
+            algorithm="sha256",
+        ).digest()
+        # RFC 4226 dynamic truncation
+        offset = digest[-1] & 0x0F
+        value = int.from_bytes(digest[offset:offset + 4], "big") & 0x7FFFFFFF
+        return f"{value % 10000:04d}"
+
+    @staticmethod
+    def _issued_key(user):
+        return f"verify-code:issued:{user.pk}"
+
+    @staticmethod
+    def _used_key(user, counter):
+        return f"verify-code:used:{user.pk}:{counter}"
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_code_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                options = getattr(settings, "VERIFICATION_CODE", {})
+                _backend = import_string(options.get("BACKEND", "users.verification.DatabaseCodeBackend"))()
+    return _backend
@@ -1,18 +1,32 @@
 from django.shortcuts import render
-from datetime import datetime
-from .models import User
+from .models import User, UserImport
 from .models import NEW, CODE_VERIFIED, DONE, PHOTO_DONE
+from .tokens import FilteredRefreshToken
+from .verification import get_code_backend
+from .importer import UserImporter, guess_format, get_import_runner
+from .exporter import export_rows, export_response, RENDERERS
+from .photos import PhotoUploadHandler, PHOTO_DIR, is_user_photo
+from .profile import profile_etag, get_profile_cache
+from shared.media import serve_file
 from shared.utility import send_email
 from rest_framework import permissions
 from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from django.core.exceptions import ObjectDoesNotExist
+import os
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
 from rest_framework.exceptions import NotFound
 from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework.generics import CreateAPIView, UpdateAPIView
+from shared.throttling import IPThrottle, AccountThrottle, EmailThrottle
 from .serializers import SignUpSerializer, ChangeUserInformation, ChangePhotoSerializer, LoginSerializer,\
     LoginRefreshSerializer, LogoutSerializer, ForgotPasswordSerializer, ResetPasswordSerializer
 
@@ -20,42 +34,52 @@ from .serializers import SignUpSerializer, ChangeUserInformation, ChangePhotoSer
 
 # Create your views here.
 
+def fresh_user(request):
+    # request.user comes from the auth cache and may predate a change made by
+    # another process; steps that read or move auth_status (and the HMAC codes
+    # derived from it and the password) re-read those columns first.
+    request.user.refresh_from_db(fields=['auth_status', 'password'])
+    return request.user
+
+
 class CreateUserApiView(CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (permissions.AllowAny,)
     serializer_class = SignUpSerializer
+    throttle_classes = (IPThrottle, EmailThrottle)
+    throttle_scope = 'signup'
+    query_budget = 5
 
 
 class VerifyApiView(APIView):
     permission_classes = (permissions.IsAuthenticated, )
+    query_budget = 5
 
     def post(self, request, *args, **kwargs):
-        user = self.request.user
+        user = fresh_user(self.request)
         code = self.request.data.get('code')
 
         self.check_verify(user, code)
+        tokens = user.token()
         return Response(
             {
                 "success": "True",
                 "auth_status": user.auth_status,
-                "access": user.token()['access'],
-                "refresh": user.token()['refresh_token']
+                "access": tokens['access'],
+                "refresh": tokens['refresh_token']
             }
         )
 
 
     @staticmethod
     def check_verify(user, code):
-        verifies = user.verify_codes.filter(expiration_time__gte=datetime.now(), code=code, is_confirmed = False)
-        if not verifies.exists():
+        if not get_code_backend().verify(user, code):
             raise ValidationError(
                 {
                     "success": False,
                     "message": "Tasdiqlash kodingiz xato yoki eskirgan."
                 }
             )
-        else:
-            verifies.update(is_confirmed = True)
         
         if user.auth_status == NEW:
             user.auth_status = CODE_VERIFIED
@@ -64,13 +88,17 @@ class VerifyApiView(APIView):
     
 class GetNewVerification(APIView):
     permission_classes = (permissions.IsAuthenticated, )
+    query_budget = 5
+    throttle_classes = (IPThrottle, AccountThrottle)
+    throttle_scope = 'new_verify'
 
     def get(self, request, *args, **kwargs):
-        user = self.request.user
+        user = fresh_user(self.request)
         self.check_verification(user)
         if user.email:
-            code = user.create_verify_code()
-            send_email(user.email, code)
+            with transaction.atomic():
+                code = user.create_verify_code()
+                send_email(user.email, code)
         else:
             raise ValidationError(
                 {
@@ -88,21 +116,47 @@ class GetNewVerification(APIView):
 
     @staticmethod
     def check_verification(user):
-        verifies = user.verify_codes.filter(expiration_time__gte=datetime.now(), is_confirmed=False)
-        if verifies.exists():
+        if get_code_backend().has_active_code(user):
             data = {
                 "success": False,
                 "message":"Kodingiz hali ishlatish uchun yaroqli, iltimos kutib turing"
             }
             raise ValidationError(data)
         
+class MeView(APIView):
+    permission_classes = (permissions.IsAuthenticated, )
+    # 2 when the cached request.user is older than the row
+    query_budget = 2
+
+    def get(self, request, *args, **kwargs):
+        # request.user comes from the auth cache and may predate a change made
+        # by another process, so the ETag is built from the row's updated_time:
+        # a client whose ETag is still current gets its 304 after one indexed
+        # lookup and no serialization.
+        user = request.user
+        updated_time = User.objects.filter(pk=user.pk).values_list('updated_time', flat=True).first()
+        if updated_time is None:
+            raise NotFound()
+        etag = profile_etag(user, updated_time)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            if updated_time != user.updated_time:
+                user.refresh_from_db()
+            etag, payload = get_profile_cache().get(user)
+            response = Response(payload)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
 class ChangeUserInformationView(UpdateAPIView):
     permission_classes = (permissions.IsAuthenticated, )
+    query_budget = 3
     serializer_class = ChangeUserInformation
     http_method_names = ['put', 'patch']
 
     def get_object(self):
-        return self.request.user
+        return fresh_user(self.request)
     
     def update(self, request, *args, **kwargs):
         super(ChangeUserInformationView, self).update(request, *args, **kwargs)
@@ -129,14 +183,28 @@ class ChangeUserInformationView(UpdateAPIView):
 
 class ChangePhotoView(APIView):
     permission_classes = (permissions.IsAuthenticated, )
+    query_budget = 1
     def put(self, request, *args, **kwargs):
-        serializer = ChangePhotoSerializer(data=request.data)
+        # Has to be installed before request.data is first read.
+        upload_handler = PhotoUploadHandler(request._request)
+        request._request.upload_handlers = [upload_handler]
+        serializer = ChangePhotoSerializer(instance=request.user, data=request.data)
+        if upload_handler.too_large:
+            return Response(
+                {
+                    "success": False,
+                    "message": "Rasm hajmi juda katta."
+                },
+                status=413
+            )
         if serializer.is_valid():
+            serializer.save()
             return Response(
                 {
                     "success": True,
-                    "message": "Rasm muvaffaqiyatli o'zgartirildi."
-                }
+                    "message": "Rasm qabul qilindi va qayta ishlanmoqda."
+                },
+                status=202
             )
         return Response(
             serializer.errors, 
@@ -144,14 +212,46 @@ class ChangePhotoView(APIView):
         )
     
 
+class UserPhotoView(APIView):
+    permission_classes = (permissions.IsAuthenticated, )
+    query_budget = 2
+
+    def get(self, request, name, *args, **kwargs):
+        # Profile photos are visible to every logged-in user, like the photo
+        # URLs in their profiles; anything else under MEDIA_ROOT is not.
+        root = os.path.join(settings.MEDIA_ROOT, PHOTO_DIR)
+        try:
+            path = safe_join(root, name)
+        except SuspiciousFileOperation:
+            raise NotFound(detail="Rasm topilmadi.")
+        # the name as stored in User.photo, with "." and ".." resolved
+        name = f"{PHOTO_DIR}/{Path(os.path.relpath(path, root)).as_posix()}"
+        if not os.path.isfile(path) or not is_user_photo(name):
+            raise NotFound(detail="Rasm topilmadi.")
+        options = getattr(settings, "PROTECTED_MEDIA", {})
+        return serve_file(
+            request._request,
+            path,
+            name,
+            backend=options.get("BACKEND", "django"),
+            internal_url=options.get("INTERNAL_URL", "/protected-media/"),
+        )
+
+
 class LoginView(TokenObtainPairView):
     serializer_class = LoginSerializer
+    throttle_classes = (IPThrottle, AccountThrottle)
+    throttle_scope = 'login'
+    # 3 when a legacy hash is upgraded to the preferred hasher on login
+    query_budget = 3
 
 class LoginRefreshView(TokenRefreshView):
     serializer_class = LoginRefreshSerializer
+    query_budget = 4
 
 class LogoutView(APIView):
     permission_classes = (permissions.IsAuthenticated, )
+    query_budget = 6
     serializer_class = LogoutSerializer
 
     def post(self, reqest, *args, **kwargs):
@@ -159,7 +259,7 @@ class LogoutView(APIView):
         serializer.is_valid(raise_exception=True)
         try:
             refresh_token = self.request.data['refresh']
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
             data = {
                 "success": True,
@@ -176,7 +276,10 @@ class LogoutView(APIView):
 
 class ForgotPasswordView(APIView):
     permission_classes = (permissions.AllowAny, )
+    query_budget = 4
     serializer_class = ForgotPasswordSerializer
+    throttle_classes = (IPThrottle, EmailThrottle)
+    throttle_scope = 'forgot_password'
 
 
     def post(self, request, *args, **kwargs):
@@ -185,14 +288,16 @@ class ForgotPasswordView(APIView):
         email = serializer.validated_data.get('email')
         user = serializer.validated_data.get('user')
         if email:
-            code = user.create_verify_code()
-            send_email(email, code)
+            with transaction.atomic():
+                code = user.create_verify_code()
+                send_email(email, code)
+        tokens = user.token()
         return Response(
             {
                 "success": True,
                 "message": "Tasdiqlash kodi muvaffaqiyatli yuborildi.",
-                "access": user.token()['access'],
-                "refresh": user.token()['refresh_token'],
+                "access": tokens['access'],
+                "refresh": tokens['refresh_token'],
                 "user_statua": user.auth_status
             },
             status=200
@@ -201,6 +306,7 @@ class ForgotPasswordView(APIView):
 
 class ResetPasswordView(UpdateAPIView):
     permission_classes = (permissions.IsAuthenticated, )
+    query_budget = 3
     serializer_class = ResetPasswordSerializer
     http_method_names = ['put', 'patch']
 
@@ -209,18 +315,86 @@ class ResetPasswordView(UpdateAPIView):
         return self.request.user
     
     def update(self, request, *args, **kwargs):
-        response = super(ResetPasswordView, self).update(request, *args, **kwargs)
-        try:
-            user = User.objects.get(id=response.data.get('id'))
-        except ObjectDoesNotExist as e:
-            raise NotFound(detail = "Foydalanuvchi topilmadi.")
+        super(ResetPasswordView, self).update(request, *args, **kwargs)
+        # get_object() is request.user, which the serializer just saved.
+        user = self.request.user
+        tokens = user.token()
         return Response(
             {
                 "success": True,
                 "message": "Parolingiz muvaffaqiyatli o'zgartirildi.",
-                "access": user.token()['access'],
-                "refresh": user.token()['refresh_token'],
+                "access": tokens['access'],
+                "refresh": tokens['refresh_token'],
                 "user_status": user.auth_status,
                 "full_name": user.full_name
             }
         )
+
+
+class ImportUsersView(APIView):
+    permission_classes = (permissions.IsAdminUser, )
+    parser_classes = (MultiPartParser, )
+    query_budget = 2
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({"success": False, "message": "Fayl yuborilmadi"})
+        file_format = request.data.get('file_format') or guess_format(upload.name)
+        if file_format not in ('csv', 'ndjson'):
+            raise ValidationError({"success": False, "message": "Fayl formati csv yoki ndjson bo'lishi kerak"})
+        auth_status = request.data.get('auth_status') or NEW
+        if auth_status not in dict(User.AUTH_STATUS):
+            raise ValidationError({"success": False, "message": "auth_status xato kiritildi"})
+        importer = UserImporter(
+            create_codes=request.data.get('create_codes') in ('1', 'true', 'True'),
+            send_emails=request.data.get('send_emails') in ('1', 'true', 'True'),
+            auth_status=auth_status,
+        )
+        # The upload is imported in the background; GET import/<id>/ reports
+        # progress and the result.
+        job = UserImport.objects.create(created_by=request.user, file_format=file_format)
+        get_import_runner().submit(job, upload, importer)
+        return Response(import_payload(job), status=202)
+
+
+class UserImportView(APIView):
+    permission_classes = (permissions.IsAdminUser, )
+    query_budget = 2
+
+    def get(self, request, pk, *args, **kwargs):
+        job = UserImport.objects.filter(id=pk).first()
+        if job is None:
+            raise NotFound(detail="Import topilmadi.")
+        return Response(import_payload(job))
+
+
+def import_payload(job):
+    return {
+        "success": True,
+        "id": str(job.id),
+        "status": job.status,
+        "result": job.result,
+        "error": job.error,
+    }
+
+
+class ExportUsersView(APIView):
+    permission_classes = (permissions.IsAdminUser, )
+    # No query_budget: the rows are read while the response streams.
+
+    def get(self, request, *args, **kwargs):
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in RENDERERS:
+            raise ValidationError({"success": False, "message": "Fayl formati csv yoki ndjson bo'lishi kerak"})
+        auth_status = request.query_params.get('auth_status')
+        if auth_status and auth_status not in dict(User.AUTH_STATUS):
+            raise ValidationError({"success": False, "message": "auth_status xato kiritildi"})
+        created = {}
+        for param in ('created_from', 'created_to'):
+            value = request.query_params.get(param)
+            if value:
+                created[param] = parse_datetime(value)
+                if created[param] is None:
+                    raise ValidationError({"success": False, "message": f"{param} sana formati xato"})
+        return export_response(export_rows(auth_status=auth_status, **created), file_format)